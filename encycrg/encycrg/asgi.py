@@ -0,0 +1,17 @@
+"""
+ASGI config for encycrg project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Set async_views=1 in the [encycrg] section of the config file so that the
+busiest views run asynchronously (see rg.asyncviews).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
+"""
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "encycrg.settings")
+
+application = get_asgi_application()
@@ -12,7 +12,6 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 import configparser
 import logging
 import os
-import socket
 import subprocess
 import sys
 from urllib.parse import urlparse
@@ -113,6 +112,9 @@ DOCSTORE_CLUSTER = docstore.cluster(
     config.get('elasticsearch', 'docstore_clusters'), DOCSTORE_HOST
 )
 
+# Use async views (for ASGI deployments, see encycrg.asgi and rg.asyncviews)
+ASYNC_VIEWS = config.getboolean('encycrg', 'async_views', fallback=False)
+
 # Page size for browse and search results
 PAGE_SIZE = 25
 # Maximum page size; used when returning entire sets
@@ -137,7 +139,7 @@ MEDIA_URL = config.get('media', 'media_url')
 # TODO Hard-coded! Replace with value from encycrg.cfg.
 MEDIA_URL_LOCAL = config.get('media', 'media_url_local')
 MEDIA_URL_LOCAL_NETLOC = urlparse(MEDIA_URL_LOCAL).netloc
-MEDIA_URL_LOCAL_IP = socket.gethostbyname(urlparse(MEDIA_URL_LOCAL).netloc)
+# MEDIA_URL_LOCAL_IP is resolved on first use (rg.context_processors)
 
 # used when document signature image field not populated
 MISSING_IMG = config.get('media', 'missing_img')
@@ -185,6 +187,10 @@ INSTALLED_APPS = [
 ]
 
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rg.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
@@ -210,13 +216,32 @@ DATABASES = {
 REDIS_HOST = '127.0.0.1'
 REDIS_PORT = '6379'
 REDIS_DB_CACHE = 1
+REDIS_DB_PREPARED = 2
 REDIS_DB_SORL = 4
 
 CACHES = {
+    # Per-worker LRU in front of 'redis' (see rg.tieredcache).
+    # Run "manage.py invalidatecache" after publishing to empty it everywhere.
     'default': {
+        "BACKEND": "rg.tieredcache.TieredCache",
+        "LOCATION": "redis",
+        "OPTIONS": {
+            "L1_MAX_ENTRIES": 1000,  # per worker
+            "L1_TIMEOUT": 10,        # seconds
+            "STAMP_INTERVAL": 1,     # seconds between invalidation checks
+        },
+    },
+    'redis': {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
         "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB_CACHE}",
     },
+    # Prepared article bodies (see rg.prepared).
+    # Use django.core.cache.backends.filebased.FileBasedCache to keep them
+    # on local disk instead.
+    'prepared': {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB_PREPARED}",
+    },
 }
 
 # whole-site caching
@@ -225,14 +250,40 @@ CACHE_MIDDLEWARE_SECONDS = int(config.get('encycrg', 'cache_timeout'))
 CACHE_MIDDLEWARE_KEY_PREFIX = 'encycrg'
 # low-level caching
 CACHE_TIMEOUT = int(config.get('encycrg', 'cache_timeout'))
+# article body transform engine: 'lxml' (fast) or 'bs4' (see rg.htmlprep)
+PREPARE_ENGINE = 'lxml'
+# prepared article bodies, keyed by url_title and modified
+PREPARED_CACHE = 'prepared'
+PREPARED_CACHE_TIMEOUT = 60*60*24*30  # 30 days
+PREPARED_LRU_SIZE = 500  # per worker
+# modified dates for ETag/Last-Modified (see rg.conditional)
+CONDITIONAL_LRU_SIZE = 10000  # per worker
+# rendered article cards for list pages (see rg.cards)
+CARD_CACHE = 'default'
+CARD_CACHE_TIMEOUT = 60*60*24*7  # 7 days
 
 # ElasticSearch
 ELASTICSEARCH_MAX_SIZE = 10000
 ELASTICSEARCH_QUERY_TIMEOUT = 60 * 10  # 10 min
 ELASTICSEARCH_FACETS_TIMEOUT = 60*60*1  # 1 hour
+# threads per worker process for concurrent lookups (see rg.fetch)
+FETCH_WORKERS = 8
+# Seconds between checks for re-published indexes (see rg.generation)
+GENERATION_CHECK_INTERVAL = 30
+# Lifetime of cache entries keyed by generation (see rg.generation.cache_page)
+GENERATION_CACHE_TIMEOUT = 60*60*24*30  # 30 days
+# Max seconds one worker may spend rebuilding a stale page (see rg.stalecache)
+CACHE_LOCK_TIMEOUT = 60
+# Serve browse pages from an in-memory facet snapshot (see rg.facets)
+FACET_SNAPSHOT = True
 
 RESULTS_PER_PAGE = 25
 
+# How long an API ?cursor= stays valid between pages
+API_CURSOR_KEEPALIVE = '10m'
+# Most documents in one API ?ids= request
+API_IDS_MAX = 100
+
 # sorl-thumbnail
 THUMBNAIL_KVSTORE = 'sorl.thumbnail.kvstores.cached_db_kvstore.KVStore'
 #THUMBNAIL_KVSTORE = 'sorl.thumbnail.kvstores.redis_kvstore.KVStore'
@@ -263,7 +314,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -272,6 +322,13 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'rg.context_processors.sitewide',
             ],
+            # compile each template once per process (see also rg.registry)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
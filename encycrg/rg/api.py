@@ -9,10 +9,16 @@ from rest_framework.reverse import reverse
 from rest_framework.response import Response
 
 from django.conf import settings
-from django.http import HttpResponsePermanentRedirect
+from django.http import HttpResponseBadRequest, HttpResponsePermanentRedirect
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.cache import add_never_cache_headers
+from django.utils.text import compress_sequence
 
 from elastictools import docstore
+from . import conditional
 from . import search as docstore_search
+from . import export as rg_export
 from . import models
 
 
@@ -24,6 +30,179 @@ def redirect(request):
     return HttpResponsePermanentRedirect(reverse('rg-api-index'))
 
 
+# always included in objects when ?fields= is used
+PROJECTION_KEYS = ['id', 'model', 'doctype', 'links']
+
+def _fields(request, model=None):
+    """Fields requested with ?fields=title,modified
+    
+    @param request
+    @param model: str For lists, only models.LIST_FIELDS[model] are allowed
+    @returns: list (empty if all fields)
+    @raises: ValueError
+    """
+    allowed = models.LIST_FIELDS[model] if model else None
+    return rg_export.parse_list(request.GET.get('fields'), allowed)
+
+def _project(obj, fields):
+    """Only the requested fields of an object (and PROJECTION_KEYS)
+    """
+    if not fields:
+        return obj
+    return OrderedDict(
+        (key,value) for key,value in obj.items()
+        if key in fields or key in PROJECTION_KEYS
+    )
+
+def _project_list(data, fields):
+    if fields:
+        data['objects'] = [_project(obj, fields) for obj in data['objects']]
+    return data
+
+def _bad_fields(err):
+    return Response(
+        {'detail': 'Bad fields. %s' % err}, status=status.HTTP_400_BAD_REQUEST
+    )
+
+def _ids(request):
+    """IDs requested with ?ids=a,b,c or a POST body {"ids": ["a", "b", "c"]}
+    
+    Repeat ?ids= (?ids=a&ids=b) for titles that contain commas.
+    
+    @param request
+    @returns: list, or None if no ids were requested
+    @raises: ValueError
+    """
+    if request.method == 'POST':
+        ids = request.data
+        if isinstance(ids, dict):
+            ids = ids.get('ids')
+            if isinstance(ids, str):
+                ids = rg_export.parse_list(ids)
+    else:
+        values = request.GET.getlist('ids')
+        if not values:
+            return None
+        if len(values) == 1:
+            ids = rg_export.parse_list(values[0])
+        else:
+            ids = values
+    if not ids or not isinstance(ids, list) \
+       or not all(isinstance(doc_id, str) for doc_id in ids):
+        raise ValueError('Give a list of ids.')
+    if len(ids) > settings.API_IDS_MAX:
+        raise ValueError('No more than %s ids.' % settings.API_IDS_MAX)
+    return ids
+
+def _by_ids(request, model, ids):
+    """Response with full objects for a list of ids, fetched with one mget
+    
+    Objects are in the order of ids; missing ones are {id, detail}.
+    """
+    try:
+        fields = _fields(request)
+    except ValueError as err:
+        return _bad_fields(err)
+    if model == 'article':
+        body = not fields or any(field in models.PAGE_BODY_FIELDS for field in fields)
+        docs = models.Page.get_many(ids, body=body)
+    elif model == 'author':
+        docs = models.Author.get_many(ids)
+    else:
+        docs = models.Source.get_many(ids)
+    data = OrderedDict()
+    data['total'] = len(ids)
+    data['objects'] = [
+        _project(doc.dict_all(request), fields) if doc
+        else OrderedDict([('id', doc_id), ('detail', 'Not found.')])
+        for doc_id,doc in zip(ids, docs)
+    ]
+    return Response(data)
+
+def _limit_offset(request):
+    """limit and offset from the query, checked
+    
+    @returns: (int limit, int offset)
+    @raises: ValueError unless 1 <= limit and 0 <= offset
+    """
+    try:
+        limit = int(request.GET.get('limit', settings.PAGE_SIZE))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        raise ValueError('Bad limit or offset.')
+    if limit < 1 or offset < 0:
+        raise ValueError('Bad limit or offset.')
+    return limit, offset
+
+def _cursor(request, model, filters=None, fields=None):
+    """Response with one page of objects for cursor (deep) pagination
+    
+    Start a walk with ?cursor= (empty) and follow the 'next' cursor until it
+    is null.  Each page costs the same regardless of depth, and the whole
+    walk sees the index as it was when it started.
+    """
+    format_function = models.FORMATTERS[models.DOCSTORE.index_name(model)]
+    return _cursor_response(
+        request,
+        lambda limit,cursor: models.cursor_results(
+            model, limit, cursor, filters, fields
+        ),
+        lambda hit: _project(
+            format_function(hit.to_dict(), request, listitem=True), fields
+        ),
+    )
+
+def _cursor_response(request, walk, format_hit, extra=None):
+    """Response with one page of a cursor walk
+    
+    @param request
+    @param walk: function(limit, cursor) returning (hits, total, next_cursor)
+    @param format_hit: function(hit) returning dict, or None to skip the hit
+    @param extra: dict Added to the response before 'objects'
+    """
+    try:
+        limit = int(request.GET.get('limit', settings.PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if not (1 <= limit <= settings.ELASTICSEARCH_MAX_SIZE):
+        return Response(
+            {'detail': 'Bad limit. Use 1 to %s.' % settings.ELASTICSEARCH_MAX_SIZE},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    cursor = request.GET.get('cursor')
+    try:
+        hits,total,next_cursor = walk(limit, cursor)
+    except ValueError:
+        return Response(
+            {'detail': 'Bad cursor.'}, status=status.HTTP_400_BAD_REQUEST
+        )
+    except models.NotFoundError:
+        return Response(
+            {'detail': 'Cursor expired. Start again with ?cursor='},
+            status=status.HTTP_410_GONE
+        )
+    data = OrderedDict()
+    data['total'] = total
+    data['limit'] = limit
+    data.update(extra or {})
+    data['cursor'] = cursor
+    data['next'] = next_cursor
+    data['next_api'] = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        data['next_api'] = request.build_absolute_uri(
+            '%s?%s' % (request.path, params.urlencode())
+        )
+    data['objects'] = [
+        obj for obj in (format_hit(hit) for hit in hits) if obj is not None
+    ]
+    response = Response(data)
+    # each page holds a point-in-time id; never serve one from a cache
+    add_never_cache_headers(response)
+    return response
+
+
 @api_view(['GET'])
 def index(request, format=None):
     data = OrderedDict()
@@ -32,76 +211,181 @@ def index(request, format=None):
     data['authors'] = reverse('rg-api-authors', request=request)
     data['sources'] = reverse('rg-api-sources', request=request)
     data['search'] = reverse('rg-api-search', request=request)
+    data['export'] = reverse('rg-api-export', request=request)
+    data['changes'] = reverse('rg-api-changes', request=request)
     return Response(data)
 
-@api_view(['GET'])
+@conditional.listing
+@api_view(['GET', 'POST'])
 def articles(request, format=None):
+    try:
+        ids = _ids(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
+    if ids is not None:
+        return _by_ids(request, 'article', ids)
+    try:
+        fields = _fields(request, 'article')
+    except ValueError as err:
+        return _bad_fields(err)
+    if 'cursor' in request.GET:
+        return _cursor(request, 'article', fields=fields)
+    try:
+        limit,offset = _limit_offset(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
     data = models.Page.pages(
-        limit=request.GET.get('limit', settings.PAGE_SIZE),
-        offset=request.GET.get('offset', 0),
+        limit=limit,
+        offset=offset,
+        fields=fields,
     ).ordered_dict(
         format_functions=models.FORMATTERS,
         request=request,
         pad=False,
     )
-    data.pop('aggregations') # TODO aggregations are not JSON serializable
-    return Response(data)
+    return Response(_project_list(data, fields))
 
-@api_view(['GET'])
+@conditional.listing
+@api_view(['GET', 'POST'])
 def authors(request, format=None):
+    try:
+        ids = _ids(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
+    if ids is not None:
+        return _by_ids(request, 'author', ids)
+    try:
+        fields = _fields(request, 'author')
+    except ValueError as err:
+        return _bad_fields(err)
+    if 'cursor' in request.GET:
+        return _cursor(request, 'author', fields=fields)
+    try:
+        limit,offset = _limit_offset(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
     data = models.Author.authors(
-        limit=request.GET.get('limit', settings.PAGE_SIZE),
-        offset=request.GET.get('offset', 0),
+        limit=limit,
+        offset=offset,
+        fields=fields,
     ).ordered_dict(
         format_functions=models.FORMATTERS,
         request=request,
         pad=False,
     )
-    data.pop('aggregations') # TODO aggregations are not JSON serializable
-    return Response(data)
+    return Response(_project_list(data, fields))
 
-@api_view(['GET'])
+@conditional.listing
+@api_view(['GET', 'POST'])
 def sources(request, format=None):
+    try:
+        ids = _ids(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
+    if ids is not None:
+        return _by_ids(request, 'source', ids)
+    try:
+        fields = _fields(request, 'source')
+    except ValueError as err:
+        return _bad_fields(err)
+    if 'cursor' in request.GET:
+        return _cursor(request, 'source', fields=fields)
+    try:
+        limit,offset = _limit_offset(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
     data = models.Source.sources(
-        limit=request.GET.get('limit', settings.PAGE_SIZE),
-        offset=request.GET.get('offset', 0),
+        limit=limit,
+        offset=offset,
+        fields=fields,
     ).ordered_dict(
         format_functions=models.FORMATTERS,
         request=request,
         pad=False,
     )
-    data.pop('aggregations') # TODO aggregations are not JSON serializable
-    return Response(data)
+    return Response(_project_list(data, fields))
 
+@conditional.document('article')
 @api_view(['GET'])
 def article(request, url_title, format=None):
     try:
-        article = models.Page.get(url_title)
-        article.prepare()
-        return Response(
-            article.dict_all(request)
-        )
+        fields = _fields(request)
+    except ValueError as err:
+        return _bad_fields(err)
+    # the article text is only fetched and prepared if it is wanted
+    body = not fields or any(field in models.PAGE_BODY_FIELDS for field in fields)
+    try:
+        article = models.Page.get(url_title, body=body)
     except models.NotFoundError:
+        article = None
+    if not article:
         return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response(
+        _project(article.dict_all(request), fields)
+    )
 
+@conditional.document('author')
 @api_view(['GET'])
 def author(request, url_title, format=None):
+    try:
+        fields = _fields(request)
+    except ValueError as err:
+        return _bad_fields(err)
     try:
         return Response(
-            models.Author.get(url_title).dict_all(request)
+            _project(models.Author.get(url_title).dict_all(request), fields)
         )
     except models.NotFoundError:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+@conditional.document('source')
 @api_view(['GET'])
 def source(request, url_title, format=None):
+    try:
+        fields = _fields(request)
+    except ValueError as err:
+        return _bad_fields(err)
     try:
         return Response(
-            models.Source.get(url_title).dict_all(request)
+            _project(models.Source.get(url_title).dict_all(request), fields)
         )
     except models.NotFoundError:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['GET'])
+def changes(request, format=None):
+    """Articles, authors, and sources modified since a time, oldest first
+    
+    ?since=2023-04-01T00:00:00Z (or a date; omit for everything), then
+    follow 'next' until it is null.  Save the last object's 'modified' and
+    use it as ?since= next time.  Objects modified exactly then come
+    again, so syncing must be idempotent.
+    
+    Only articles published in the Resource Guide are listed.  Articles
+    taken out of the RG and documents removed from the index are not
+    listed; mirrors should reconcile against a full ?cursor= walk now and
+    then.
+    """
+    since = request.GET.get('since') or None
+    if since:
+        try:
+            parsed = parse_datetime(since) or parse_date(since)
+        except ValueError:
+            parsed = None
+        if not parsed:
+            return Response(
+                {'detail': 'Bad since. Use an ISO 8601 date or time.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Elasticsearch wants e.g. 2023-04-01T00:00:00, not 2023-04-01 00:00
+        since = parsed.isoformat()
+    return _cursor_response(
+        request,
+        lambda limit,cursor: models.change_results(limit, cursor, since),
+        lambda hit: models.format_change(hit, request),
+        {'since': since},
+    )
+
 def _browse(request):
     fields = []
     for key,val in models.FACET_FIELDS.items():
@@ -131,21 +415,98 @@ def browse_facet(request, stub, format=None):
 
 @api_view(['GET'])
 def browse_facet_objects(request, stub, value, format=None):
+    try:
+        fields = _fields(request, 'article')
+    except ValueError as err:
+        return _bad_fields(err)
+    if 'cursor' in request.GET:
+        if stub not in models.MEDIATYPE_URLSTUBS:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return _cursor(
+            request, 'article', {models.MEDIATYPE_URLSTUBS[stub]: value},
+            fields=fields,
+        )
+    try:
+        limit,offset = _limit_offset(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
     results = models.Page.browse_field_objects(
-        stub, value,
-        limit=request.GET.get('limit', settings.PAGE_SIZE),
-        offset=request.GET.get('offset', 0),
+        stub, value, limit=limit, offset=offset, fields=fields,
     )
-    return Response(
+    return Response(_project_list(
         results.ordered_dict(
             format_functions=models.FORMATTERS,
             request=request,
             pad=False,
-        )
+        ),
+        fields
+    ))
+
+@api_view(['GET'])
+def browse_filter(request, format=None):
+    """Articles matching a combination of facets
+    
+    ?media-type=books&interest-level=Grades+6-8&availability=Widely+available
+    Repeat a parameter to match any of several terms; add operator=and to
+    require all of them.
+    """
+    try:
+        fields = _fields(request, 'article')
+    except ValueError as err:
+        return _bad_fields(err)
+    try:
+        limit,offset = _limit_offset(request)
+    except ValueError as err:
+        return Response({'detail': str(err)}, status=status.HTTP_400_BAD_REQUEST)
+    results = models.Page.browse_filter(
+        models.facets.filters_from_query(request.GET),
+        operator=request.GET.get('operator', 'or'),
+        limit=limit,
+        offset=offset,
     )
+    return Response(_project_list(
+        results.ordered_dict(
+            format_functions=models.FORMATTERS,
+            request=request,
+            pad=False,
+        ),
+        fields
+    ))
+
+def export(request):
+    """Stream every published article, author, and source as NDJSON
+    
+    ?models=article,author,source  Which models, in order (default all)
+    ?fields=url_title,title        Only these _source fields (default all)
+    Gzipped if the client accepts it.
+    """
+    try:
+        export_models = rg_export.parse_list(
+            request.GET.get('models'), rg_export.EXPORT_MODELS
+        ) or rg_export.EXPORT_MODELS
+    except ValueError as err:
+        return HttpResponseBadRequest(str(err))
+    fields = rg_export.parse_list(request.GET.get('fields'))
+    lines = rg_export.ndjson(rg_export.documents(export_models, fields))
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = StreamingHttpResponse(
+            compress_sequence(lines), content_type=rg_export.CONTENT_TYPE
+        )
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(
+            lines, content_type=rg_export.CONTENT_TYPE
+        )
+    response['Vary'] = 'Accept-Encoding'
+    response['Content-Disposition'] = 'attachment; filename="encycrg.ndjson"'
+    return response
 
 @api_view(['GET'])
 def search(request, format=None):
+    try:
+        fields = _fields(request, 'article')
+    except ValueError as err:
+        return _bad_fields(err)
     searcher = docstore_search.Searcher(models.DOCSTORE)
     if request.GET.get('fulltext'):
         params = request.GET.copy()
@@ -157,6 +518,7 @@ def search(request, format=None):
             fields=models.PAGE_SEARCH_FIELDS,
             fields_nested={},
             fields_agg=models.PAGE_AGG_FIELDS,
+            source_fields=models.source_fields('article', fields),
         )
     if searcher.params.get('fulltext'):
         limit,offset = docstore_search.limit_offset(request, settings.RESULTS_PER_PAGE)
@@ -165,7 +527,5 @@ def search(request, format=None):
             format_functions=models.FORMATTERS,
             pad=False,
         )
-        # TODO aggregations are not JSON serializable
-        data.pop('aggregations')
-        return Response(data)
+        return Response(_project_list(data, fields))
     return Response({})
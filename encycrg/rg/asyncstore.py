@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Asynchronous docstore access for the async views (see rg.asyncviews)
+
+An AsyncElasticsearch client talks to the same cluster and indexes as
+models.DOCSTORE, so that a view can wait on Elasticsearch without holding
+a worker thread.  aiohttp sessions belong to an event loop, so there is
+one client per running loop; under an ASGI server that means one per
+worker process.  A client is closed when its loop shuts down its async
+generators, as asyncio.run() and asgiref's async_to_sync do before closing
+the loop.
+
+The client is built with elasticsearch-py 7.x arguments (use_ssl, scheme,
+http_auth, timeout); requirements.txt pins elasticsearch<8 accordingly.
+
+Functions return the same objects as the sync model methods
+(e.g. get_page() returns what models.Page.get returns) and raise the same
+elasticsearch.exceptions.NotFoundError.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from elasticsearch import AsyncElasticsearch
+
+from django.conf import settings
+
+from . import models
+
+
+_clients = {}
+_closers = {}
+
+async def _close_with_loop(loop, es):
+    """Async generator that closes es when loop shuts down async generators
+    """
+    try:
+        yield
+    finally:
+        _clients.pop(loop, None)
+        _closers.pop(loop, None)
+        await es.close()
+
+def client():
+    """AsyncElasticsearch client for the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    es = _clients.get(loop)
+    if es is None:
+        kwargs = {
+            'hosts': [settings.DOCSTORE_HOST],
+            'timeout': settings.DOCSTORE_TIMEOUT,
+        }
+        if settings.DOCSTORE_SSL_CERTFILE:
+            kwargs['scheme'] = 'https'
+            kwargs['use_ssl'] = True
+            kwargs['ca_certs'] = settings.DOCSTORE_SSL_CERTFILE
+        if settings.DOCSTORE_PASSWORD:
+            kwargs['http_auth'] = (
+                settings.DOCSTORE_USERNAME, settings.DOCSTORE_PASSWORD
+            )
+        es = _clients[loop] = AsyncElasticsearch(**kwargs)
+        # started now, so loop.shutdown_asyncgens() runs its finally
+        closer = _closers[loop] = _close_with_loop(loop, es)
+        asyncio.ensure_future(closer.asend(None))
+    return es
+
+async def get(doc_class, model, doc_id, fields=None, excludes=None):
+    """Get one document as a model object
+
+    @param doc_class: class models.Page, models.Author, models.Source
+    @param model: str 'article', 'author', 'source'
+    @param doc_id: str
+    @param fields: list Only these fields
+    @param excludes: list Not these fields
+    @returns: doc_class object
+    """
+    kwargs = {}
+    if fields:
+        kwargs['_source_includes'] = fields
+    if excludes:
+        kwargs['_source_excludes'] = excludes
+    raw = await client().get(
+        index=models.DOCSTORE.index_name(model), id=doc_id, **kwargs
+    )
+    return doc_class.from_es(raw)
+
+async def search(doc_class, model, s):
+    """Execute an elasticsearch_dsl.Search and return model objects
+
+    @param doc_class: class models.Page, models.Author, models.Source
+    @param model: str 'article', 'author', 'source'
+    @param s: elasticsearch_dsl.Search
+    @returns: list of doc_class objects
+    """
+    raw = await client().search(
+        index=models.DOCSTORE.index_name(model), body=s.to_dict()
+    )
+    return [doc_class.from_es(hit) for hit in raw['hits']['hits']]
+
+async def get_page(url_title, body=True):
+    """Async models.Page.get: published RG Page, prepared, or None
+
+    @param url_title: str
+    @param body: bool See models.Page.get
+    """
+    page = await get(
+        models.Page, 'article', url_title,
+        excludes=None if body else models.PAGE_BODY_FIELDS,
+    )
+    if not page.published_rg:
+        return None
+    if body:
+        # prepare() may read or write the prepared-body cache
+        await sync_to_async(page.prepare, thread_sensitive=False)()
+    return page
+
+async def sources_for_headword(url_title, size=100, fields=None):
+    """Async models.Source.for_headword
+    """
+    s = models.search.Search().filter('term', headword=url_title)
+    if fields:
+        s = s.source(fields)
+    return await search(models.Source, 'source', s.extra(size=size))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Async versions of the busiest views, for ASGI deployments
+
+When settings.ASYNC_VIEWS is True (encycrg.asgi under an ASGI server such as
+uvicorn), rg.urls routes these URLs here instead of to rg.views and rg.api.
+
+- article waits on Elasticsearch through rg.asyncstore, so one worker can
+  keep many requests in flight.
+- the API views, search and browse run the existing sync views in the
+  thread pool (thread_sensitive=False).  The API views stay DRF views, so
+  throttling, format negotiation, the browsable API and conditional GET
+  (rg.conditional) work the same under ASGI.  The elastictools Searcher
+  has no async counterpart, and browse is mostly served from the
+  in-memory facet snapshot.  Under ASGI, Django would otherwise run every
+  sync view in a single shared thread.
+
+Django 4.1's cache_page does not work with async views, so the article view
+caches its rendered HTML itself, keyed on the content generation like
+rg.generation.cache_page.
+"""
+
+import asyncio
+import functools
+import hashlib
+
+from asgiref.sync import sync_to_async
+import elasticsearch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponsePermanentRedirect
+
+from . import api
+from . import asyncstore
+from . import generation
+from . import models
+from . import titles
+from . import views
+
+
+def threaded(view):
+    """Async view that runs a sync view in the thread pool
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(view, thread_sensitive=False)(
+            request, *args, **kwargs
+        )
+    return wrapper
+
+
+async def article(request, url_title):
+    prefix = await sync_to_async(
+        generation.key_prefix, thread_sensitive=False
+    )()
+    key = 'encyc-rg:article-html:%s:%s' % (prefix, hashlib.sha1(
+        request.get_full_path().encode('utf-8')
+    ).hexdigest())
+    html = await cache.aget(key)
+    if html is not None:
+        return HttpResponse(html)
+    # unknown titles are answered without asking Elasticsearch
+    is_article = await sync_to_async(
+        titles.INDEX.is_article, thread_sensitive=False
+    )(url_title)
+    if not is_article:
+        # may refresh the title index
+        redirect_url = await sync_to_async(
+            titles.INDEX.redirect, thread_sensitive=False
+        )(url_title)
+        if redirect_url:
+            return HttpResponsePermanentRedirect(redirect_url)
+        raise Http404("No article with that title.")
+    # the article and its sources are fetched at the same time
+    page,sources = await asyncio.gather(
+        asyncstore.get_page(url_title),
+        asyncstore.sources_for_headword(
+            url_title, fields=models.ARTICLE_SOURCE_FIELDS
+        ),
+        return_exceptions=True,
+    )
+    if isinstance(page, elasticsearch.exceptions.NotFoundError):
+        # Bad title might be a MediaWiki-style title or an author link
+        redirect_url = await sync_to_async(
+            titles.INDEX.redirect, thread_sensitive=False
+        )(url_title)
+        if redirect_url:
+            return HttpResponsePermanentRedirect(redirect_url)
+        raise Http404("No article with that title. (%s)" % page)
+    if isinstance(page, Exception):
+        raise page
+    if not page:
+        raise Http404("No article with that title.")
+    # choose only the first source
+    source = None
+    if page.source_ids:
+        if not isinstance(sources, Exception):
+            source = views._first_source(page, sources)
+        if not source:
+            # source filed under a different headword
+            try:
+                source = await asyncstore.get(
+                    models.Source, 'source', page.source_ids[0],
+                    fields=models.ARTICLE_SOURCE_FIELDS,
+                )
+            except elasticsearch.exceptions.NotFoundError:
+                pass
+    response = await sync_to_async(
+        views._render_article, thread_sensitive=False
+    )(request, url_title, page, source)
+    await cache.aset(key, response.content, settings.GENERATION_CACHE_TIMEOUT)
+    return response
+
+
+search_ui = threaded(views.search_ui)
+browse_field = threaded(views.browse_field)
+browse_field_value = threaded(views.browse_field_value)
+browse_filter = threaded(views.browse_filter)
+api_article = threaded(api.article)
+api_author = threaded(api.author)
+api_source = threaded(api.source)
+api_search = threaded(api.search)
+api_browse_facet_objects = threaded(api.browse_facet_objects)
+api_browse_filter = threaded(api.browse_filter)
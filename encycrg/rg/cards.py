@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Cache of rendered article cards for list pages
+
+Browse, search and title-list pages show each article as a card rendered
+from the article's list fields with a per-mediatype template
+(see rg.registry).  A card only changes when the article is re-published,
+so cards are cached under (links.html, modified, template).  links.html is
+used rather than url_title because it is an absolute URL and
+differs between hostnames.  If a list item has no modified, the article index
+generation is used instead.  Keys also include the app version and git
+commit, so a deploy with new templates or static URLs starts afresh.
+
+All the cards on a page are fetched with one get_many, only the misses are
+rendered, and they are stored with one set_many.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.safestring import mark_safe
+
+from . import generation
+from . import models
+from . import registry
+
+
+def card_template(article):
+    mediatype = article.get('rg_rgmediatype', [])
+    return registry.REGISTRY.get('list', mediatype[0] if mediatype else None)
+
+def render_card(article, template=None):
+    """Render one card
+
+    @param article: dict Page list item (see models.format_page)
+    @param template: Template (default: list template for mediatype)
+    @returns: SafeString
+    """
+    if template is None:
+        template = card_template(article)
+    return template.render({
+        'article': article,
+        'fields': models.FACET_FIELDS,
+    })
+
+def card_key(article, template):
+    """Cache key for an article card
+    """
+    modified = article.get('modified') or generation.ARTICLES.current()
+    if hasattr(modified, 'isoformat'):
+        modified = modified.isoformat()
+    url = article.get('links', {}).get('html') or article.get('url_title', '')
+    return 'encyc-rg:card:%s:%s:%s:%s' % (
+        hashlib.sha1(
+            ('%s:%s' % (settings.VERSION, settings.GIT_COMMIT)).encode('utf-8')
+        ).hexdigest()[:12],
+        template.template.name,
+        hashlib.sha1(url.encode('utf-8')).hexdigest(),
+        modified,
+    )
+
+def render_cards(articles):
+    """Render cards for a list of articles, using cached cards where possible
+
+    @param articles: list of dicts Page list items
+    @returns: SafeString
+    """
+    cache = caches[settings.CARD_CACHE]
+    templates = [card_template(article) for article in articles]
+    keys = [
+        card_key(article, template)
+        for article,template in zip(articles, templates)
+    ]
+    cached = cache.get_many(keys)
+    rendered = {}
+    cards = []
+    for article,template,key in zip(articles, templates, keys):
+        card = cached.get(key) or rendered.get(key)
+        if card is None:
+            card = rendered[key] = str(render_card(article, template))
+        cards.append(card)
+    if rendered:
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+    return mark_safe('\n'.join(cards))
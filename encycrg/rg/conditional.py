@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Conditional GET (ETag and Last-Modified) for pages and API resources
+
+Wraps Django's condition() decorator, so If-None-Match and If-Modified-Since
+are answered with 304 before the view renders or serializes anything.
+
+- document(model): views of one article, author, or source.  Validators
+  come from the document's modified, fetched alone from Elasticsearch and
+  remembered per worker until the content generation changes.  Pages also
+  show other documents (an author's articles, an article's sources), so the
+  ETag includes the content generation and Last-Modified is never earlier
+  than the newest document in it.
+- listing: list views.  The ETag is the content generation.  Cursor
+  pages, ?ids= lookups, and POSTs get no validators, since their responses
+  are not determined by the URL and generation alone (a cursor page holds
+  a new point-in-time id).
+
+ETags also include the app version and the Accept header, since the API
+views return HTML or JSON at the same URL.
+"""
+
+from datetime import timezone
+import functools
+import hashlib
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
+
+from . import generation
+from . import models
+from . import search
+from . import titles
+from .prepared import LRUCache
+
+
+# (model, url_title): (generation token, modified datetime or None)
+MODIFIED = LRUCache(settings.CONDITIONAL_LRU_SIZE)
+
+
+def modified(model, url_title):
+    """When a published document was last modified
+
+    @param model: str 'article', 'author', 'source'
+    @param url_title: str
+    @returns: datetime (aware), or None if there is no such published
+        document or its modified can't be parsed
+    """
+    if model == 'article' and not titles.INDEX.is_article(url_title):
+        return None
+    token = generation.CONTENT.current()
+    cached = MODIFIED.get((model, url_title))
+    if cached and cached[0] == token:
+        return cached[1]
+    value = None
+    doc = search.get_fields(
+        models.DOCSTORE, model, url_title, ['modified', 'published_rg']
+    )
+    if doc and doc.get('modified') and (
+            model != 'article' or doc.get('published_rg')):
+        try:
+            value = parse_datetime(doc['modified'])
+        except ValueError:
+            value = None
+        if value and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)  # ES dates are UTC
+    MODIFIED.set((model, url_title), (token, value))
+    return value
+
+def make_etag(request, *parts):
+    """Quoted ETag from the app version, Accept header, and parts
+    """
+    text = ':'.join(
+        [settings.VERSION, settings.GIT_COMMIT, request.META.get('HTTP_ACCEPT', '')]
+        + [str(part) for part in parts]
+    )
+    return '"%s"' % hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def document(model):
+    """condition() for views that take url_title
+
+    @param model: str 'article', 'author', 'source'
+    """
+    def etag(request, url_title, **kwargs):
+        value = modified(model, url_title)
+        if value:
+            return make_etag(
+                request, model, url_title, value.isoformat(),
+                generation.key_prefix()
+            )
+        return None
+
+    def last_modified(request, url_title, **kwargs):
+        value = modified(model, url_title)
+        newest = generation.last_modified()
+        if value and newest:
+            return max(value, newest)
+        return value
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+_listing_condition = condition(
+    etag_func=lambda request, *args, **kwargs: make_etag(
+        request, generation.key_prefix()
+    )
+)
+
+# query parameters whose responses can't be validated by generation
+UNCACHEABLE_PARAMS = {'cursor', 'ids'}
+
+def listing(view):
+    """condition() for list views, keyed on the content generation
+    """
+    conditional_view = _listing_condition(view)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method in ('GET', 'HEAD')
+                and not UNCACHEABLE_PARAMS.intersection(request.GET)):
+            return conditional_view(request, *args, **kwargs)
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -1,7 +1,30 @@
 from datetime import datetime
 import os
+import socket
+from urllib.parse import urlparse
 
 from django.conf import settings
+from django.utils.functional import lazy
+
+
+# resolved IP, or None until resolved
+_media_url_local_ip = None
+
+def media_url_local_ip():
+    """IP address of the MEDIA_URL_LOCAL host
+    
+    Resolved the first time a page shows it rather than at startup.
+    Failures are not remembered, so a later page tries again.
+    """
+    global _media_url_local_ip
+    if _media_url_local_ip is None:
+        try:
+            _media_url_local_ip = socket.gethostbyname(
+                urlparse(settings.MEDIA_URL_LOCAL).hostname
+            )
+        except (socket.error, TypeError, UnicodeError):
+            return ''
+    return _media_url_local_ip
 
 
 def sitewide(request):
@@ -21,7 +44,7 @@ def sitewide(request):
         'encycrg_cluster': settings.DOCSTORE_CLUSTER,
         'base_template': settings.BASE_TEMPLATE,
         'MEDIA_URL_LOCAL_NETLOC': settings.MEDIA_URL_LOCAL_NETLOC,
-        'MEDIA_URL_LOCAL_IP': settings.MEDIA_URL_LOCAL_IP,
+        'MEDIA_URL_LOCAL_IP': lazy(media_url_local_ip, str)(),
         'static_url': settings.STATIC_URL,
         'google_analytics_id': settings.GOOGLE_ANALYTICS_ID,
         'site_msg_text': settings.SITE_MSG_TEXT,
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Bulk export of the Resource Guide as newline-delimited JSON (NDJSON)
+
+Every published article, author, and source, one JSON document per line,
+read from the docstore with the scroll API.  Lines are generated one at a
+time so memory use does not depend on the size of the corpus.  Used by
+api.export (/api/3.0/export/) and the exportrg management command.
+
+Each line is the document's _source (or the requested ?fields= subset)
+plus 'model': 'article', 'author', or 'source'.
+"""
+
+import json
+
+from . import models
+from . import search
+
+
+EXPORT_MODELS = ['article', 'author', 'source']
+
+CONTENT_TYPE = 'application/x-ndjson'
+
+
+def parse_list(text, allowed=None):
+    """List from comma-separated query param, optionally checked
+
+    @param text: str e.g. 'url_title,title' or None
+    @param allowed: list Allowed values
+    @returns: list (empty if text is empty)
+    """
+    if not text:
+        return []
+    values = [value.strip() for value in text.split(',') if value.strip()]
+    if allowed:
+        bad = [value for value in values if value not in allowed]
+        if bad:
+            raise ValueError('Unknown value(s): %s' % ','.join(bad))
+    return values
+
+def documents(export_models=EXPORT_MODELS, fields=[]):
+    """Published documents of each model, one after another
+
+    Articles are filtered on published_rg, an article-only field, as in
+    models.cursor_results.  Authors and sources are exported as they are.
+
+    @param export_models: list of 'article', 'author', 'source'
+    @param fields: list of _source fields (all fields if empty)
+    @returns: generator of dicts
+    """
+    for model in export_models:
+        for doc in search.scan_fields(
+                models.DOCSTORE, model, fields or None,
+                published_rg=(model == 'article')
+        ):
+            doc['model'] = model
+            yield doc
+
+def ndjson(docs):
+    """Encode documents as NDJSON lines
+
+    @param docs: iterable of dicts
+    @returns: generator of bytes
+    """
+    for doc in docs:
+        yield (json.dumps(doc, default=str) + '\n').encode('utf-8')
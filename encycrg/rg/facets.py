@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""In-memory snapshot of the browse facets
+
+The facet vocabulary and the articles under each term only change when the
+Resource Guide is republished.  A FacetSnapshot holds, for every published
+article, the fields needed to list it, plus for every browsable field a map
+of term -> sorted array of article ordinals.  Ordinals are positions in the
+title_sort-ordered article list.  Each term also has a bitset (a Python int
+with bit n set for ordinal n) so that combinations of facets can be
+intersected with a few integer operations; see FacetSnapshot.select().
+
+The snapshot is built from one scan of the article index and replaced
+whenever the article index generation changes.  Replacement is a single
+reference assignment, so a request that has called current() keeps using a
+consistent snapshot even if a new one is swapped in meanwhile.
+
+models.Page.browse_field and models.Page.browse_field_objects use the
+snapshot when settings.FACET_SNAPSHOT is True.
+"""
+
+from array import array
+from collections import OrderedDict
+import logging
+logger = logging.getLogger(__name__)
+import threading
+
+from . import generation
+from . import models
+from . import search
+
+
+class FacetSnapshot():
+    """Published articles and their facet terms, in title order
+    """
+
+    def __init__(self, token, docs, fields):
+        """
+        @param token: str Article index generation
+        @param docs: list of dicts with list and facet fields
+        @param fields: list of facet fieldnames
+        """
+        self.generation = token
+        self.docs = sorted(docs, key=lambda doc: doc.get('title_sort') or '')
+        self.fields = fields
+        self.terms = {}
+        self.bitsets = {}
+        for field in fields:
+            terms = {}
+            for n,doc in enumerate(self.docs):
+                values = doc.get(field) or []
+                if isinstance(values, str):
+                    values = [values]
+                for value in set(values):
+                    terms.setdefault(value, []).append(n)
+            self.terms[field] = {
+                term: array('I', ordinals)
+                for term,ordinals in terms.items()
+            }
+            self.bitsets[field] = {
+                term: _bitset(ordinals)
+                for term,ordinals in terms.items()
+            }
+
+    @staticmethod
+    def build(token):
+        """Build a snapshot from one scan of the article index
+
+        @param token: str Article index generation
+        @returns: FacetSnapshot
+        """
+        facet_fields = list(models.PAGE_AGG_FIELDS.keys())
+        fields = list(OrderedDict.fromkeys(
+            models.PAGE_LIST_FIELDS + facet_fields
+        ))
+        docs = list(search.scan_fields(
+            models.DOCSTORE, 'article', fields, published_rg=True
+        ))
+        return FacetSnapshot(token, docs, facet_fields)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def counts(self, field):
+        """Terms and document counts for field, most common first
+
+        @param field: str Page fieldname e.g. 'rg_rgmediatype'
+        @returns: list of {'key': term, 'doc_count': int}
+        """
+        return [
+            {'key': term, 'doc_count': len(ordinals)}
+            for term,ordinals in sorted(
+                self.terms[field].items(),
+                key=lambda item: (-len(item[1]), item[0])
+            )
+        ]
+
+    def ordinals(self, field, term):
+        """Ordinals of articles with term in field
+
+        @param field: str Page fieldname e.g. 'rg_rgmediatype'
+        @param term: str e.g. 'books'
+        @returns: array of int
+        """
+        return self.terms[field].get(term, array('I'))
+
+    def select(self, filters, operator='or'):
+        """Bitset of articles matching a combination of facet terms
+
+        Fields are ANDed together.  Terms within a field are ORed, or ANDed
+        if operator is 'and'.  Unknown fields or terms match nothing.
+
+        @param filters: dict {fieldname: [term, ...]}
+        @param operator: str 'or' or 'and'
+        @returns: int bitset
+        """
+        selected = (1 << len(self.docs)) - 1
+        for field,terms in filters.items():
+            bitsets = self.bitsets.get(field, {})
+            if operator == 'and':
+                combined = selected
+                for term in terms:
+                    combined &= bitsets.get(term, 0)
+            else:
+                combined = 0
+                for term in terms:
+                    combined |= bitsets.get(term, 0)
+            selected &= combined
+        return selected
+
+    def results(self, ordinals, limit, offset):
+        """One page of articles
+
+        @param ordinals: sequence of int
+        @param limit: int
+        @param offset: int
+        @returns: SnapshotResults
+        """
+        return SnapshotResults(self, ordinals, limit, offset)
+
+
+def _bitset(ordinals):
+    """int with bit n set for each ordinal n (ordinals must be ascending)
+    """
+    if not ordinals:
+        return 0
+    buf = bytearray(ordinals[-1] // 8 + 1)
+    for n in ordinals:
+        buf[n >> 3] |= 1 << (n & 7)
+    return int.from_bytes(buf, 'little')
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+# set bit positions of each byte value, lowest first
+_BYTE_BITS = [
+    tuple(bit for bit in range(8) if byte & (1 << bit)) for byte in range(256)
+]
+
+
+class Ordinals():
+    """Ascending ordinals of the set bits in a bitset
+
+    Supports len() and slicing without expanding the whole bitset.
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.length = _popcount(bits)
+        self._bytes = None
+
+    def __len__(self):
+        return self.length
+
+    def _data(self):
+        if self._bytes is None:
+            self._bytes = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+        return self._bytes
+
+    def __iter__(self):
+        for n,byte in enumerate(self._data()):
+            for bit in _BYTE_BITS[byte]:
+                yield n * 8 + bit
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('Ordinals only supports slicing')
+        positions = range(*key.indices(self.length))
+        if not positions:
+            return []
+        low = min(positions)
+        high = max(positions) + 1
+        # skip whole bytes before low, stop after high
+        ordinals = []
+        count = 0
+        for n,byte in enumerate(self._data()):
+            bits = _BYTE_BITS[byte]
+            if count + len(bits) <= low:
+                count += len(bits)
+                continue
+            for bit in bits:
+                if count >= low:
+                    ordinals.append(n * 8 + bit)
+                count += 1
+                if count >= high:
+                    break
+            if count >= high:
+                break
+        return [ordinals[position - low] for position in positions]
+
+
+class SnapshotResults():
+    """Page of snapshot articles with the SearchResults interface
+
+    Provides the attributes and ordered_dict() output used by the views
+    and API.
+    """
+
+    def __init__(self, snapshot, ordinals, limit, offset):
+        self.limit = int(limit)
+        self.offset = int(offset)
+        if self.limit < 1 or self.offset < 0:
+            raise ValueError('limit must be >= 1 and offset >= 0')
+        self.total = len(ordinals)
+        self.objects = [
+            snapshot.docs[n]
+            for n in ordinals[self.offset:self.offset + self.limit]
+        ]
+        self.query = {}
+        self.aggregations = {}
+        self.page_size = self.limit
+        self.this_page = self.offset // self.limit + 1
+        self.prev_offset = None
+        self.next_offset = None
+        if self.offset - self.limit >= 0:
+            self.prev_offset = self.offset - self.limit
+        if self.offset + self.limit < self.total:
+            self.next_offset = self.offset + self.limit
+
+    def _api_url(self, request, offset):
+        if not request or offset is None:
+            return None
+        params = request.GET.copy()
+        params['limit'] = self.limit
+        params['offset'] = offset
+        return request.build_absolute_uri(
+            '%s?%s' % (request.path, params.urlencode())
+        )
+
+    def ordered_dict(self, request, format_functions, pad=False):
+        """Structure results like SearchResults.ordered_dict
+
+        @param request: django.http.request.HttpRequest
+        @param format_functions: dict e.g. models.FORMATTERS
+        @param pad: bool Fill unused slots before and after page with dicts
+        @returns: OrderedDict
+        """
+        format_function = format_functions[models.DOCSTORE.index_name('article')]
+        data = OrderedDict()
+        data['total'] = self.total
+        data['limit'] = self.limit
+        data['offset'] = self.offset
+        data['prev_offset'] = self.prev_offset
+        data['next_offset'] = self.next_offset
+        data['page_size'] = self.page_size
+        data['this_page'] = self.this_page
+        data['num_this_page'] = len(self.objects)
+        data['prev_api'] = self._api_url(request, self.prev_offset)
+        data['next_api'] = self._api_url(request, self.next_offset)
+        data['objects'] = []
+        if pad:
+            data['objects'] += [{'n': n} for n in range(0, self.offset)]
+        data['objects'] += [
+            format_function(dict(doc), request, listitem=True)
+            for doc in self.objects
+        ]
+        if pad:
+            data['objects'] += [
+                {'n': n}
+                for n in range(self.offset + len(self.objects), self.total)
+            ]
+        data['query'] = self.query
+        data['aggregations'] = self.aggregations
+        return data
+
+
+def filters_from_query(query):
+    """Facet filters from URL query, keyed by browse URL stub
+
+    Example: ?media-type=books&interest-level=Grades+6-8&interest-level=Adult
+    -> {'rg_rgmediatype': ['books'], 'rg_interestlevel': ['Grades 6-8', 'Adult']}
+    Parameters that are not browse URL stubs are ignored.
+
+    @param query: django.http.QueryDict
+    @returns: dict {fieldname: [term, ...]}
+    """
+    return {
+        models.MEDIATYPE_URLSTUBS[stub]: values
+        for stub,values in query.lists()
+        if stub in models.MEDIATYPE_URLSTUBS and values
+    }
+
+
+class FacetSnapshots():
+    """Holds the current FacetSnapshot for this worker
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Snapshot for the current article index generation
+
+        The first request after a republish builds the new snapshot; other
+        threads keep serving the previous one until it is swapped in.
+
+        @returns: FacetSnapshot
+        """
+        token = generation.ARTICLES.current()
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.generation == token:
+            return snapshot
+        if snapshot is not None and not self._lock.acquire(blocking=False):
+            return snapshot
+        if snapshot is None:
+            self._lock.acquire()
+        try:
+            if self.snapshot is None or self.snapshot.generation != token:
+                logger.info('building facet snapshot %s' % token)
+                self.snapshot = FacetSnapshot.build(token)
+            return self.snapshot
+        finally:
+            self._lock.release()
+
+
+SNAPSHOTS = FacetSnapshots()
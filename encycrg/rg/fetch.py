@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Run a view's independent docstore lookups at the same time
+
+A view that needs several documents usually fetches them one after another,
+so its latency is the sum of the round trips.  A FetchPlan submits each
+lookup to a worker pool shared by the whole process and collects the
+results, so the view waits about as long as the slowest lookup.
+
+    plan = fetch.FetchPlan()
+    plan.add('article', models.Page.get, url_title)
+    plan.add('sources', models.Source.for_headword, url_title)
+    article = plan.result('article')  # raises if Page.get raised
+
+The pool has settings.FETCH_WORKERS threads, so lookups from all requests
+in a worker process share a fixed number of connections to the cluster.
+The Elasticsearch client is thread-safe.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+logger = logging.getLogger(__name__)
+import threading
+
+from django.conf import settings
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def executor():
+    """Process-wide ThreadPoolExecutor, created on first use
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.FETCH_WORKERS,
+                    thread_name_prefix='rg-fetch',
+                )
+    return _executor
+
+
+class FetchPlan():
+    """Named lookups for one request, running concurrently
+    """
+
+    def __init__(self):
+        self.futures = {}
+
+    def add(self, name, function, *args, **kwargs):
+        """Start function(*args, **kwargs) in the pool
+
+        @param name: str
+        @param function: callable
+        """
+        self.futures[name] = executor().submit(function, *args, **kwargs)
+
+    def result(self, name):
+        """Wait for a lookup and return its value, or raise its exception
+
+        @param name: str
+        @returns: value returned by the function
+        """
+        return self.futures[name].result(
+            timeout=settings.ELASTICSEARCH_QUERY_TIMEOUT
+        )
+
+    def cancel(self):
+        """Cancel lookups that have not started yet
+        """
+        for future in self.futures.values():
+            future.cancel()
@@ -9,15 +9,24 @@ from . import models
 
 
 class SearchForm(forms.Form):
+    """Fulltext search form with a filter field for each aggregation
+    
+    Choices and doc counts come from search_results.aggregations or, when
+    there are no search results, from aggregations e.g. from
+    models.Page.facet_counts().
+    """
     search_results = None
+    aggregations = None
     
     def __init__( self, *args, **kwargs ):
-        if kwargs.get('search_results'):
-            self.search_results = kwargs.pop('search_results')
+        self.search_results = kwargs.pop('search_results', None)
+        self.aggregations = kwargs.pop('aggregations', None)
         super(SearchForm, self).__init__(*args, **kwargs)
-        self.fields = self.construct_form(self.search_results)
+        if self.search_results:
+            self.aggregations = self.search_results.aggregations
+        self.fields = self.construct_form(self.aggregations)
 
-    def construct_form(self, search_results):
+    def construct_form(self, aggregations):
         fields = [
             (
                 'fulltext',
@@ -36,14 +45,14 @@ class SearchForm(forms.Form):
         ]
         
         # fill in options and doc counts from aggregations
-        if search_results and search_results.aggregations:
-            for fieldname in search_results.aggregations.keys():
+        if aggregations:
+            for fieldname in aggregations.keys():
                 choices = [
                     (
                         item['key'],
                         '%s (%s)' % (item['key'], item['doc_count'])
                     )
-                    for item in search_results.aggregations[fieldname]
+                    for item in aggregations[fieldname]
                 ]
                 if choices:
                     fields.append((
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Index generations
+
+The Resource Guide is published by re-indexing documents into Elasticsearch;
+nothing tells the web workers when that happens.  A generation is a cheap
+fingerprint of one or more indexes (see search.index_stamp).  In-process
+structures record the generation they were built from and rebuild when it
+changes.
+
+The fingerprint is polled at most once every GENERATION_CHECK_INTERVAL
+seconds per worker.  CONTENT is the only poller: ARTICLES and other subsets
+are read from its token, so one request per interval covers them all.
+
+Cached pages and data are keyed by the CONTENT generation (see key_prefix
+and cache_page) rather than expiring after a fixed time: they stay valid until
+something is published, and entries from old generations are never read again
+and expire after GENERATION_CACHE_TIMEOUT.
+"""
+
+from datetime import datetime, timezone
+import functools
+import hashlib
+import logging
+logger = logging.getLogger(__name__)
+import threading
+import time
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators import cache as cache_decorators
+
+from . import search
+
+
+class Generation():
+    """Polls the fingerprint of a set of indexes
+
+    >>> gen = Generation(['article'])
+    >>> gen.current()
+    'article:1234-1672531200000'
+    """
+
+    def __init__(self, models, interval=None):
+        """
+        @param models: list of str e.g. ['article', 'author']
+        @param interval: int Seconds between polls
+        """
+        self.models = models
+        if interval is None:
+            interval = settings.GENERATION_CHECK_INTERVAL
+        self.interval = interval
+        self._token = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Return generation token, polling docstore if interval has passed
+
+        @returns: str
+        """
+        if (time.monotonic() - self._checked) > self.interval:
+            with self._lock:
+                # another thread may have polled while we waited
+                if (time.monotonic() - self._checked) > self.interval:
+                    self._token = self.poll()
+                    self._checked = time.monotonic()
+        return self._token
+
+    def poll(self):
+        """Fetch generation token from docstore
+
+        @returns: str
+        """
+        from . import models
+        return '|'.join([
+            '%s:%s' % (model, search.index_stamp(models.DOCSTORE, model))
+            for model in self.models
+        ])
+
+    def last(self):
+        """Return the last polled token without polling
+
+        @returns: str, or None if never polled
+        """
+        return self._token
+
+    def expire(self):
+        """Force a poll on the next call to current()
+        """
+        self._checked = 0
+
+
+class Subset():
+    """Generation of some of the indexes of a polled Generation
+
+    >>> Subset(CONTENT, ['article']).current()
+    'article:1234-1672531200000'
+    """
+
+    def __init__(self, generation, models):
+        """
+        @param generation: Generation
+        @param models: list of str, a subset of generation.models
+        """
+        self.generation = generation
+        self.models = models
+
+    def _select(self, token):
+        if token is None:
+            return None
+        return '|'.join([
+            part for part in token.split('|')
+            if part.split(':', 1)[0] in self.models
+        ])
+
+    def current(self):
+        return self._select(self.generation.current())
+
+    def last(self):
+        return self._select(self.generation.last())
+
+    def expire(self):
+        self.generation.expire()
+
+
+CONTENT = Generation(['article', 'author', 'source'])
+ARTICLES = Subset(CONTENT, ['article'])
+
+
+def key_prefix(generation=CONTENT):
+    """Cache key prefix for the current generation
+
+    @param generation: Generation
+    @returns: str e.g. 'g5f2b9a01c3d4'
+    """
+    token = generation.current()
+    return 'g%s' % hashlib.sha1(token.encode('utf-8')).hexdigest()[:12]
+
+def last_modified(generation=CONTENT):
+    """Newest modified of any document in the generation's indexes
+
+    @param generation: Generation
+    @returns: datetime (UTC), or None if no document has a modified
+    """
+    stamps = [
+        int(part.rsplit('-', 1)[-1])
+        for part in generation.current().split('|')
+        if part.rsplit('-', 1)[-1].isdigit()
+    ]
+    if not stamps or not max(stamps):
+        return None
+    return datetime.fromtimestamp(max(stamps) / 1000, tz=timezone.utc)
+
+def cache_page(view):
+    """Like django.views.decorators.cache.cache_page, keyed on CONTENT
+
+    Pages are cached for GENERATION_CACHE_TIMEOUT under the current
+    key_prefix.  Browsers are still told max-age=CACHE_TIMEOUT, since they
+    cannot tell when the generation changes.
+    """
+    @functools.wraps(view)
+    def browser_max_age(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, max_age=settings.CACHE_TIMEOUT)
+        return response
+
+    # (key_prefix, cached view) for the current generation
+    current = (None, None)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        nonlocal current
+        prefix = key_prefix()
+        if current[0] != prefix:
+            current = (prefix, cache_decorators.cache_page(
+                settings.GENERATION_CACHE_TIMEOUT, key_prefix=prefix
+            )(browser_max_age))
+        return current[1](request, *args, **kwargs)
+    return wrapper
+
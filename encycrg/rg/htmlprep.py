@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Article body transform engines
+
+Page.prepare() cleans up the body HTML exported from MediaWiki:
+- removes databox display tables, the table of contents and toplinks
+- points "notrg" links at the Encyclopedia
+- rewrites "rg" links to Resource Guide URLs (no underscores, trailing slash)
+- splits the accordion sections out of the body
+
+Two engines do the same job:
+- "bs4": BeautifulSoup with html.parser, prettified output.  The original
+  implementation, kept as the reference.
+- "lxml": single pass over an lxml tree, compact output.  Several times
+  faster, and the output is smaller.  Apart from whitespace, the markup is
+  the same as bs4's.  Depending on its version, libxml2 percent-encodes
+  spaces and non-ASCII characters in URL attributes ("Brian%20Niiya/"), so
+  such values are swapped for placeholders while serializing and written
+  back as they were.
+
+settings.PREPARE_ENGINE selects the engine.
+"""
+
+import html
+import re
+from urllib.parse import urljoin
+import uuid
+
+from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
+
+from django.conf import settings
+
+
+def prepare_bs4(body, databoxes, sections):
+    """
+    @param body: str Raw HTML
+    @param databoxes: list of 'DATABOX_NAME|json' strings
+    @param sections: list of (fieldname, sectionid) tuples
+    @returns: dict body and section fieldnames: HTML
+    """
+    data = {}
+    soup = BeautifulSoup(body, 'html.parser')
+
+    # rm databox display tables (note: 'Display' appended to databox name)
+    #   <div id="rgdatabox-CoreDisplay">
+    for d in [d.split('|')[0] for d in databoxes]:
+        if soup.find(id='%sDisplay' % d):
+            soup.find(id='%sDisplay' % d).decompose()
+
+    # rm table of contents div
+    #   <div class="toc" id="toc">...
+    if soup.find(id='toc'):
+        soup.find(id='toc').decompose()
+
+    # rm internal top links
+    #   <div class="toplink">...
+    for tag in soup.find_all(class_="toplink"):
+        tag.decompose()
+
+    # prepend encycfront domain for notrg links
+    for a in soup.find_all('a', class_='notrg'):
+        a['href'] = urljoin(settings.ENCYCLOPEDIA_URL, a['href'])
+
+    # rm underscores from internal links
+    # append trailing slashes to internal links
+    for a in soup.find_all('a', class_='rg'):
+        a['href'] = a['href'].replace('_', ' ')
+        if a['href'][-1] != '/':
+            a['href'] += '/'
+
+    # rm sections from soup, to separate blocks of HTML
+    #   <div class="section" id="For_More_Information">
+    #   <div class="section" id="Reviews">
+    #   <div class="section" id="Footnotes">
+    #   <div class="section" id="Related_articles">
+    #   <div class="section" id="Find_in_the_Digital_Library_of_Japanese_American_Incarceration">
+    for fieldname,sectionid in sections:
+        if soup.find(id=sectionid):
+            tag = soup.find(id=sectionid).extract()
+            data[fieldname] = tag.prettify()
+
+    data['body'] = soup.prettify()
+    return data
+
+# attributes that libxml2's HTML serializer may URI-escape
+URI_ATTRIBUTES = ['href', 'src', 'action', 'name']
+
+class _URIAttributes():
+    """Keep libxml2 from escaping URL attributes of a tree
+
+    >>> uris = _URIAttributes(root)
+    >>> html = uris.restore(etree.tostring(element, ...))
+    """
+
+    def __init__(self, root):
+        self.values = []
+        self.prefix = 'rgattr%s' % uuid.uuid4().hex
+        for element in root.iter(tag=etree.Element):
+            attrib = element.attrib
+            for key in URI_ATTRIBUTES:
+                value = attrib.get(key)
+                if value and any(c <= ' ' or c > '~' for c in value):
+                    attrib[key] = '%s%s_' % (self.prefix, len(self.values))
+                    self.values.append(html.escape(value))
+        self.pattern = re.compile(r'%s(\d+)_' % self.prefix)
+
+    def restore(self, text):
+        if not self.values:
+            return text
+        return self.pattern.sub(lambda m: self.values[int(m.group(1))], text)
+
+def _tostring(element, uris, with_tail=True):
+    return uris.restore(etree.tostring(
+        element, method='html', encoding='unicode', with_tail=with_tail
+    ))
+
+def _attached(element, root):
+    """True if element has not been cut out of the tree under root
+    """
+    while element is not None:
+        if element is root:
+            return True
+        element = element.getparent()
+    return False
+
+def prepare_lxml(body, databoxes, sections):
+    """
+    @param body: str Raw HTML
+    @param databoxes: list of 'DATABOX_NAME|json' strings
+    @param sections: list of (fieldname, sectionid) tuples
+    @returns: dict body and section fieldnames: HTML
+    """
+    data = {}
+    if not body or not body.strip():
+        data['body'] = ''
+        return data
+    root = lxml.html.fragment_fromstring(body, create_parent='div')
+
+    remove_ids = set(['%sDisplay' % d.split('|')[0] for d in databoxes])
+    remove_ids.add('toc')
+    section_ids = {sectionid: fieldname for fieldname,sectionid in sections}
+    remove = []
+    found = {}
+    for element in root.iter(tag=etree.Element):
+        attrib = element.attrib
+        eid = attrib.get('id')
+        if eid:
+            # first element with a given id, like soup.find
+            if eid in remove_ids:
+                remove.append(element)
+                remove_ids.discard(eid)
+            elif (eid in section_ids) and (eid not in found):
+                found[eid] = element
+        classes = attrib.get('class', '').split()
+        if not classes:
+            continue
+        if 'toplink' in classes:
+            remove.append(element)
+        if element.tag == 'a' and 'href' in attrib:
+            if 'notrg' in classes:
+                attrib['href'] = urljoin(settings.ENCYCLOPEDIA_URL, attrib['href'])
+            if 'rg' in classes:
+                href = attrib['href'].replace('_', ' ')
+                if not href.endswith('/'):
+                    href += '/'
+                attrib['href'] = href
+
+    for element in remove:
+        if _attached(element, root):
+            element.drop_tree()  # keeps tail text
+
+    uris = _URIAttributes(root)
+
+    for fieldname,sectionid in sections:
+        element = found.get(sectionid)
+        if element is not None and _attached(element, root):
+            data[fieldname] = _tostring(element, uris, with_tail=False)
+            element.drop_tree()
+
+    data['body'] = (root.text or '') + ''.join(
+        _tostring(child, uris) for child in root
+    )
+    return data
+
+
+ENGINES = {
+    'bs4': prepare_bs4,
+    'lxml': prepare_lxml,
+}
+
+def prepare_body(body, databoxes, sections, engine=None):
+    """Transform article body using the configured engine
+
+    @param body: str Raw HTML
+    @param databoxes: list of 'DATABOX_NAME|json' strings
+    @param sections: list of (fieldname, sectionid) tuples
+    @param engine: str Name of engine (default settings.PREPARE_ENGINE)
+    @returns: dict body and section fieldnames: HTML
+    """
+    if not engine:
+        engine = settings.PREPARE_ENGINE
+    return ENGINES[engine](body, databoxes, sections)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import json
+from pathlib import Path
+import time
+
+from django.core.management.base import BaseCommand
+
+from rg import htmlprep
+from rg import models
+from rg import search
+
+
+class Command(BaseCommand):
+    help = 'Benchmark article body transform engines over real article bodies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c', '--corpus',
+            help='Read bodies from JSONL file instead of the docstore.'
+        )
+        parser.add_argument(
+            '-d', '--dump',
+            help='Write bodies fetched from the docstore to JSONL file.'
+        )
+        parser.add_argument(
+            '-e', '--engines', default=','.join(htmlprep.ENGINES.keys()),
+            help='Comma-separated list of engines.'
+        )
+        parser.add_argument(
+            '-n', '--repeat', type=int, default=1,
+            help='Number of passes over the corpus.'
+        )
+
+    def handle(self, *args, **options):
+        if options['corpus']:
+            with Path(options['corpus']).open('r') as f:
+                docs = [json.loads(line) for line in f]
+        else:
+            docs = list(search.scan_fields(
+                models.DOCSTORE, 'article',
+                ['url_title', 'body', 'databoxes'], published_rg=True
+            ))
+        if options['dump']:
+            with Path(options['dump']).open('w') as f:
+                for doc in docs:
+                    f.write(json.dumps(doc) + '\n')
+        size_in = sum([len(doc.get('body', '')) for doc in docs])
+        self.stdout.write(f'{len(docs)} bodies, {size_in} chars')
+        for engine in options['engines'].split(','):
+            size_out = 0
+            start = time.perf_counter()
+            for n in range(options['repeat']):
+                for doc in docs:
+                    data = htmlprep.prepare_body(
+                        doc.get('body', ''), doc.get('databoxes', []),
+                        models.ACCORDION_SECTIONS, engine=engine,
+                    )
+                    size_out += sum([len(html) for html in data.values()])
+            elapsed = time.perf_counter() - start
+            per_doc = elapsed / max(len(docs) * options['repeat'], 1)
+            self.stdout.write(
+                f'{engine:6} {elapsed:8.3f}s total'
+                f' {per_doc * 1000:8.3f}ms/body'
+                f' {size_out // options["repeat"]:10} chars out'
+            )
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What a worker does before it can serve its first request
+BOOT = '; '.join([
+    'import encycrg.wsgi',
+    'import rg.urls',
+    'from django.template import engines',
+    'engines["django"].engine.template_libraries',
+])
+
+
+class Command(BaseCommand):
+    help = 'Measure worker boot time with python -X importtime.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', '--repeat', type=int, default=3,
+            help='Number of boots (fastest is reported).'
+        )
+        parser.add_argument(
+            '-t', '--top', type=int, default=15,
+            help='Number of slowest modules to list.'
+        )
+        parser.add_argument(
+            '-m', '--max-seconds', type=float,
+            help='Fail if the fastest boot takes longer than this.'
+        )
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'encycrg.settings')
+        results = []
+        for n in range(options['repeat']):
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', BOOT],
+                env=env, capture_output=True, text=True,
+            )
+            elapsed = time.perf_counter() - start
+            if proc.returncode:
+                lines = proc.stderr.strip().splitlines()
+                raise CommandError(
+                    lines[-1] if lines else 'boot exited with %s' % proc.returncode
+                )
+            results.append((elapsed, proc.stderr))
+        elapsed,importtime = min(results)
+        self.stdout.write(f'boot {elapsed:.3f}s (fastest of {len(results)})')
+        self.stdout.write('      self_us  cumulative_us  module')
+        for self_us,cumulative,module in slowest(importtime, options['top']):
+            self.stdout.write(f'{self_us:>13}  {cumulative:>13}  {module}')
+        if options['max_seconds'] and elapsed > options['max_seconds']:
+            raise CommandError(
+                f'boot took {elapsed:.3f}s, limit is {options["max_seconds"]}s'
+            )
+
+
+def slowest(importtime, top):
+    """Modules that take the longest to import, not counting their imports
+
+    @param importtime: str stderr of python -X importtime
+    @param top: int
+    @returns: list of (self microseconds, cumulative microseconds, module)
+    """
+    rows = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            rows.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+        except ValueError:
+            continue  # header
+    return sorted(rows, reverse=True)[:top]
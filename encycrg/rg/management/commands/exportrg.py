@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+from pathlib import Path
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rg import export
+
+
+class Command(BaseCommand):
+    help = 'Export all published articles, authors, and sources as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-m', '--models', default=','.join(export.EXPORT_MODELS),
+            help='Comma-separated list of models.'
+        )
+        parser.add_argument(
+            '-f', '--fields', default='',
+            help='Comma-separated list of fields (default all).'
+        )
+        parser.add_argument(
+            '-o', '--output',
+            help='Write to file instead of stdout (gzipped if name ends in .gz).'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            export_models = export.parse_list(
+                options['models'], export.EXPORT_MODELS
+            )
+        except ValueError as err:
+            raise CommandError(err)
+        fields = export.parse_list(options['fields'])
+        lines = export.ndjson(export.documents(export_models, fields))
+        if not options['output']:
+            for line in lines:
+                sys.stdout.buffer.write(line)
+            return
+        path = Path(options['output'])
+        if path.suffix == '.gz':
+            f = gzip.open(path, 'wb')
+        else:
+            f = path.open('wb')
+        num = 0
+        with f:
+            for line in lines:
+                f.write(line)
+                num += 1
+        self.stderr.write(f'{num} documents written to {path}')
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Empty the per-worker cache (L1) in every worker, e.g. after publishing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-c', '--cache', default='default',
+            help='Cache alias (default: default).'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Also clear the shared cache.'
+        )
+
+    def handle(self, *args, **options):
+        cache = caches[options['cache']]
+        if not hasattr(cache, 'invalidate'):
+            raise CommandError(f'"{options["cache"]}" is not a tiered cache')
+        if options['all']:
+            cache.clear()
+        else:
+            cache.invalidate()
+        self.stdout.write(f'invalidated {options["cache"]}')
@@ -5,26 +5,31 @@ import json
 import logging
 logger = logging.getLogger(__name__)
 import os
-from urllib.parse import urljoin
-
-from bs4 import BeautifulSoup
 
 from django.conf import settings
 from django.core.cache import cache
 from django.urls import reverse
-from rest_framework.reverse import reverse as api_reverse
+from django.utils.functional import SimpleLazyObject
+
+from elasticsearch.exceptions import NotFoundError, TransportError
 
 from elastictools import docstore
+from . import facets
+from . import generation
+from . import htmlprep
+from . import links
+from . import prepared
 from . import search
 from . import repo_models
 
 INDEX_PREFIX = 'encyc'
 
-# see if cluster is available, quit with nice message if not
-docstore.Docstore(INDEX_PREFIX, settings.DOCSTORE_HOST, settings).start_test()
-
 # set default hosts and index
-DOCSTORE = docstore.Docstore(INDEX_PREFIX, settings.DOCSTORE_HOST, settings)
+# Created on first use so that importing this module does not touch the
+# cluster; see views.ready for the availability check.
+DOCSTORE = SimpleLazyObject(
+    lambda: docstore.Docstore(INDEX_PREFIX, settings.DOCSTORE_HOST, settings)
+)
 
 DOCTYPE_CLASS = {}  # Maps doctype names to classes
 
@@ -182,6 +187,20 @@ class Author(repo_models.Author):
             title, index=ds.index_name('author'), using=ds.es
     )
 
+    @staticmethod
+    def get_many(titles):
+        """Get several Authors in one request
+        
+        @param titles: list of url_titles
+        @returns: list of Author objects, None where there is no such Author
+        """
+        if not titles:
+            return []
+        ds = DOCSTORE
+        return Author.mget(
+            titles, index=ds.index_name('author'), using=ds.es, missing='none'
+        )
+
     @staticmethod
     def search():
         """AuthorSearch
@@ -202,15 +221,8 @@ class Author(repo_models.Author):
         data['id'] = hit.url_title
         data['doctype'] = hit.meta.doc_type
         data['links'] = {}
-        data['links']['html'] = api_reverse(
-            'rg-author',
-            args=([hit.url_title]),
-            request=request,
-        )
-        data['links']['json'] = api_reverse(
-            'rg-api-author', args=([hit.url_title]),
-            request=request,
-        )
+        data['links']['html'] = links.url('rg-author', hit.url_title, request=request)
+        data['links']['json'] = links.url('rg-api-author', hit.url_title, request=request)
         return data
 
     def to_dict_list(self, request=None):
@@ -223,15 +235,8 @@ class Author(repo_models.Author):
         data['id'] = self.url_title
         data['doctype'] = u'authors'
         data['links'] = {}
-        data['links']['html'] = api_reverse(
-            'rg-author',
-            args=([self.url_title]),
-            request=request,
-        )
-        data['links']['json'] = api_reverse(
-            'rg-api-author', args=([self.url_title]),
-            request=request,
-        )
+        data['links']['html'] = links.url('rg-author', self.url_title, request=request)
+        data['links']['json'] = links.url('rg-api-author', self.url_title, request=request)
         return data
     
     def dict_all(self, request=None):
@@ -255,31 +260,52 @@ class Author(repo_models.Author):
         # overwrite
         data['articles'] = [
             OrderedDict([
-                ('title', url_title),
-                ('json', api_reverse('rg-api-article', args=([url_title]), request=request)),
-                ('html', api_reverse('rg-article', args=([url_title]), request=request)),
+                ('title', page.url_title),
+                ('json', links.url('rg-api-article', page.url_title, request=request)),
+                ('html', links.url('rg-article', page.url_title, request=request)),
             ])
-            for url_title in self.article_titles
+            for page in self.articles()
         ]
         return data
     
     def articles(self):
         """Returns list of published light Pages for this Author.
         
+        One terms query on the Author's article_titles, in title order.
+        Encyclopedia articles that are not in the Resource Guide are left out.
+        
         @returns: list
         """
+        if not self.article_titles:
+            return []
         return [
             Page.from_hit(hit)
-            for hit in Page.pages().objects
-            if page['url_title'] in self.article_titles
+            for hit in search.terms_fields(
+                DOCSTORE, 'article', 'url_title', list(self.article_titles),
+                PAGE_LIST_FIELDS, sort=['title_sort'], published_rg=True
+            )
+        ]
+
+    @staticmethod
+    def titles():
+        """List of url_titles of all Authors
+        
+        Only the url_title field is fetched.
+        
+        @returns: list
+        """
+        return [
+            doc['url_title']
+            for doc in search.scan_fields(DOCSTORE, 'author', ['url_title'])
         ]
 
     @staticmethod
-    def authors(limit=settings.MAX_SIZE, offset=0):
+    def authors(limit=settings.MAX_SIZE, offset=0, fields=None):
         """Returns list of published light Author objects.
         
         @param limit: int
         @param offset: int
+        @param fields: list Only these fields (see source_fields)
         @returns: SearchResults
         """
         searcher = search.Searcher(DOCSTORE)
@@ -291,6 +317,8 @@ class Author(repo_models.Author):
             fields=SEARCH_INCLUDE_FIELDS,
             fields_nested=[],
             fields_agg={},
+            source_fields=source_fields('author', fields),
+            published_rg=False,
         )
         return searcher.execute(limit, offset)
 
@@ -320,6 +348,7 @@ PAGE_LIST_FIELDS = [
     'url_title',
     'title',
     'title_sort',
+    'modified',
     'description',
     'categories',
     'rg_rgmediatype',
@@ -474,6 +503,8 @@ ACCORDION_SECTIONS = [
     ('related', 'Related_articles'),
     ('findatia', 'Find_in_the_Digital_Library_of_Japanese_American_Incarceration')
 ]
+# Page fields that come from the article text (see Page.get)
+PAGE_BODY_FIELDS = ['body'] + [fieldname for fieldname,sectionid in ACCORDION_SECTIONS]
 
 def format_author(document, request, listitem=False):
     """Format Page object from SearchResults to OrderedDict for lists
@@ -500,8 +531,8 @@ def format_author(document, request, listitem=False):
     if document.get('index'): d['index'] = document.pop('index')
     # links
     d['links'] = OrderedDict()
-    d['links']['html'] = api_reverse('rg-author', args=[oid], request=request)
-    d['links']['json'] = api_reverse('rg-api-author', args=[oid], request=request)
+    d['links']['html'] = links.url('rg-author', oid, request=request)
+    d['links']['json'] = links.url('rg-api-author', oid, request=request)
     # everything else
     for key in AUTHOR_LIST_FIELDS:
         if key in document.keys():
@@ -533,8 +564,8 @@ def format_page(document, request, listitem=False):
     if document.get('index'): d['index'] = document.pop('index')
     # links
     d['links'] = OrderedDict()
-    d['links']['html'] = api_reverse('rg-article', args=[oid], request=request)
-    d['links']['json'] = api_reverse('rg-api-article', args=[oid], request=request)
+    d['links']['html'] = links.url('rg-article', oid, request=request)
+    d['links']['json'] = links.url('rg-api-article', oid, request=request)
     d['title'] = document.pop('title')
     d['description'] = document.pop('description')
     # everything else
@@ -573,8 +604,8 @@ def format_source(document, request, listitem=False):
     if document.get('index'): d['index'] = document.pop('index')
     # links
     d['links'] = OrderedDict()
-    d['links']['html'] = api_reverse('rg-source', args=[oid], request=request)
-    d['links']['json'] = api_reverse('rg-api-source', args=[oid], request=request)
+    d['links']['html'] = links.url('rg-source', oid, request=request)
+    d['links']['json'] = links.url('rg-api-source', oid, request=request)
     # everything else
     for key in SOURCE_LIST_FIELDS:
         if key in document.keys():
@@ -593,59 +624,67 @@ class Page(repo_models.Page):
         return reverse('rg-article', args=([self.title]))
 
     @staticmethod
-    def get(title):
+    def get(title, body=True):
+        """
+        @param title: str url_title
+        @param body: bool If False, the article text is not fetched or
+                     prepared (dict_all has no body, databoxes, etc)
+        @returns: Page or None
+        """
         ds = DOCSTORE
+        kwargs = {}
+        if not body:
+            kwargs['_source_excludes'] = PAGE_BODY_FIELDS
         page = super(Page, Page).get(
-            id=title, index=ds.index_name('article'), using=ds.es
+            id=title, index=ds.index_name('article'), using=ds.es, **kwargs
         )
         # only show ResourceGuide items
         if not page.published_rg:
             return None
-        page.prepare()
+        if body:
+            page.prepare()
         return page
 
-    def prepare(self):
-        soup = BeautifulSoup(self.body, 'html.parser')
-        
-        # rm databox display tables (note: 'Display' appended to databox name)
-        #   <div id="rgdatabox-CoreDisplay">
-        for d in [d.split('|')[0] for d in self.databoxes]:
-            if soup.find(id='%sDisplay' % d):
-                soup.find(id='%sDisplay' % d).decompose()
-        
-        # rm table of contents div
-        #   <div class="toc" id="toc">...
-        if soup.find(id='toc'):
-            soup.find(id='toc').decompose()
-        
-        # rm internal top links
-        #   <div class="toplink">...
-        for tag in soup.find_all(class_="toplink"):
-            tag.decompose()
-
-        # prepend encycfront domain for notrg links
-        for a in soup.find_all('a', class_='notrg'):
-            a['href'] = urljoin(settings.ENCYCLOPEDIA_URL, a['href'])
-        
-        # rm underscores from internal links
-        # append trailing slashes to internal links
-        for a in soup.find_all('a', class_='rg'):
-            a['href'] = a['href'].replace('_', ' ')
-            if a['href'][-1] != '/':
-                a['href'] += '/'
+    @staticmethod
+    def get_many(titles, body=True):
+        """Get several published Pages in one request
         
-        # rm sections from soup, to separate blocks of HTML
-        #   <div class="section" id="For_More_Information">
-        #   <div class="section" id="Reviews">
-        #   <div class="section" id="Footnotes">
-        #   <div class="section" id="Related_articles">
-        #   <div class="section" id="Find_in_the_Digital_Library_of_Japanese_American_Incarceration">
-        for fieldname,sectionid in ACCORDION_SECTIONS:
-            if soup.find(id=sectionid):
-                tag = soup.find(id=sectionid).extract()
-                setattr(self, fieldname, tag.prettify())
+        @param titles: list of url_titles
+        @param body: bool See Page.get
+        @returns: list of Page objects, None where there is no such Page
+        """
+        if not titles:
+            return []
+        ds = DOCSTORE
+        kwargs = {}
+        if not body:
+            kwargs['_source_excludes'] = PAGE_BODY_FIELDS
+        pages = Page.mget(
+            titles, index=ds.index_name('article'), using=ds.es,
+            missing='none', **kwargs
+        )
+        pages = [page if page and page.published_rg else None for page in pages]
+        if body:
+            for page in pages:
+                if page:
+                    page.prepare()
+        return pages
+
+    def prepare(self):
+        """Transform body HTML for display
         
-        self.body = soup.prettify()
+        See htmlprep for the transform engines.  Each revision
+        (url_title, modified) is transformed once and kept in the
+        prepared-body store; calling this more than once is harmless.
+        """
+        data = prepared.STORE.get(self.url_title, self.modified)
+        if data is None:
+            data = htmlprep.prepare_body(
+                self.body, self.databoxes, ACCORDION_SECTIONS
+            )
+            prepared.STORE.set(self.url_title, self.modified, data)
+        for fieldname,value in data.items():
+            setattr(self, fieldname, value)
     
     @staticmethod
     def dict_list(hit, request):
@@ -659,16 +698,8 @@ class Page(repo_models.Page):
         data['id'] = hit.url_title
         data['doctype'] = hit.meta.doc_type
         data['links'] = {}
-        data['links']['html'] = api_reverse(
-            'rg-article',
-            args=([hit.url_title]),
-            request=request,
-        )
-        data['links']['json'] = api_reverse(
-            'rg-api-article',
-            args=([hit.url_title]),
-            request=request
-        )
+        data['links']['html'] = links.url('rg-article', hit.url_title, request=request)
+        data['links']['json'] = links.url('rg-api-article', hit.url_title, request=request)
         return data
 
     def to_dict_list(self, request=None):
@@ -681,16 +712,8 @@ class Page(repo_models.Page):
         data['id'] = self.url_title
         data['doctype'] = u'articles'
         data['links'] = {}
-        data['links']['html'] = api_reverse(
-            'rg-article',
-            args=([self.url_title]),
-            request=request,
-        )
-        data['links']['json'] = api_reverse(
-            'rg-api-article',
-            args=([self.url_title]),
-            request=request,
-        )
+        data['links']['html'] = links.url('rg-article', self.url_title, request=request)
+        data['links']['json'] = links.url('rg-api-article', self.url_title, request=request)
         data['title_sort'] = self.title_sort
         data['description'] = self.description
         
@@ -776,8 +799,8 @@ class Page(repo_models.Page):
         # overwrite
         data['categories'] = [
             {
-                #'json': api_reverse('rg-api-category', args=([category]), request=request),
-                #'html': api_reverse('rg-category', args=([category]), request=request),
+                #'json': links.url('rg-api-category', category, request=request),
+                #'html': links.url('rg-category', category, request=request),
                 'title': category,
             }
             for category in self.categories
@@ -790,16 +813,16 @@ class Page(repo_models.Page):
         data['sources'] = [
             OrderedDict([
                 ('id', source_id),
-                ('json', api_reverse('rg-api-source', args=([source_id]), request=request)),
-                ('html', api_reverse('rg-source', args=([source_id]), request=request)),
+                ('json', links.url('rg-api-source', source_id, request=request)),
+                ('html', links.url('rg-source', source_id, request=request)),
             ])
             for source_id in self.source_ids
         ]
         data['authors'] = [
             OrderedDict([
                 ('title', author_titles),
-                ('json', api_reverse('rg-api-author', args=([author_titles]), request=request)),
-                ('html', api_reverse('rg-author', args=([author_titles]), request=request)),
+                ('json', links.url('rg-api-author', author_titles, request=request)),
+                ('html', links.url('rg-author', author_titles, request=request)),
             ])
             for author_titles in self.authors_data['display']
         ]
@@ -808,17 +831,18 @@ class Page(repo_models.Page):
     def authors(self):
         """Returns list of published light Author objects for this Page.
         
+        All authors are fetched in one request.  Names with no Author
+        record are returned as strings.
+        
         @returns: list
         """
-        objects = []
-        if self.authors_data:
-            for url_title in self.authors_data['display']:
-                try:
-                    author = Author.get(url_title)
-                except docstore.NotFoundError:
-                    author = url_title
-                objects.append(author)
-        return objects
+        if not self.authors_data:
+            return []
+        titles = list(self.authors_data['display'])
+        return [
+            author if author is not None else url_title
+            for url_title,author in zip(titles, Author.get_many(titles))
+        ]
 
     @staticmethod
     def search():
@@ -831,11 +855,12 @@ class Page(repo_models.Page):
         return s
     
     @staticmethod
-    def pages(limit=settings.MAX_SIZE, offset=0):
+    def pages(limit=settings.MAX_SIZE, offset=0, fields=None):
         """Returns list of published light Page objects.
         
         @param limit: int
         @param offset: int
+        @param fields: list Only these fields (see source_fields)
         @returns: SearchResults
         """
         searcher = search.Searcher(DOCSTORE)
@@ -847,6 +872,7 @@ class Page(repo_models.Page):
             fields=SEARCH_INCLUDE_FIELDS,
             fields_nested=[],
             fields_agg={},
+            source_fields=source_fields('article', fields),
         )
         return searcher.execute(limit, offset)
     
@@ -890,9 +916,17 @@ class Page(repo_models.Page):
 
     @staticmethod
     def titles():
+        """List of url_titles of all published Pages
+        
+        Only the url_title field is fetched.
+        
+        @returns: list
+        """
         return [
-            hit['url_title']
-            for hit in Page.pages().objects
+            doc['url_title']
+            for doc in search.scan_fields(
+                DOCSTORE, 'article', ['url_title'], published_rg=True
+            )
         ]
      
     @staticmethod
@@ -928,7 +962,9 @@ class Page(repo_models.Page):
 
     @staticmethod
     def mediatypes():
-        KEY = u'encyc-rg:rgmediatypes'
+        KEY = u'encyc-rg:rgmediatypes:%s' % generation.key_prefix(
+            generation.ARTICLES
+        )
         data = cache.get(KEY)
         if not data:
             mediatypes = []
@@ -938,7 +974,7 @@ class Page(repo_models.Page):
                 except KeyError:
                     pass  # TODO why is this not working
             data = set(mediatypes)
-            cache.set(KEY, data, settings.CACHE_TIMEOUT)
+            cache.set(KEY, data, settings.GENERATION_CACHE_TIMEOUT)
         return data
     
     def mediatype_label(self):
@@ -977,33 +1013,14 @@ class Page(repo_models.Page):
         @returns: list of aggregations with links, labels, etc
         """
         model_field = MEDIATYPE_URLSTUBS[field]
-        # TODO don't get all the records just the aggregations
-        searcher = search.Searcher(DOCSTORE)
-        searcher.prepare(
-            params={},
-            params_whitelist=PAGE_SEARCH_FIELDS,
-            search_models=SEARCH_MODELS,
-            sort=[],
-            fields=PAGE_SEARCH_FIELDS,
-            fields_nested={},
-            fields_agg=PAGE_AGG_FIELDS,
-        )
-        response = searcher.execute(limit=settings.PAGE_SIZE, offset=0)
+        counts = Page.facet_counts([model_field])[model_field]
         data = []
-        for t in response.aggregations[model_field]:
+        for t in counts:
             term = t['key']
             item = OrderedDict()
             item['term'] = term
-            item['json'] = api_reverse(
-                'rg-api-browse-fieldvalue',
-                args=([field, term]),
-                request=request
-            )
-            item['html'] = api_reverse(
-                'rg-browse-fieldvalue',
-                args=([field, term]),
-                request=request
-            )
+            item['json'] = links.url('rg-api-browse-fieldvalue', field, term, request=request)
+            item['html'] = links.url('rg-browse-fieldvalue', field, term, request=request)
             if MEDIATYPE_INFO.get(term):
                 item['label'] = MEDIATYPE_INFO[term]['label']
             else:
@@ -1012,21 +1029,53 @@ class Page(repo_models.Page):
             data.append(item)
         return sorted(data, key=lambda item: item['label'])
     
-    def browse_field_objects(field, value, limit=settings.PAGE_SIZE, offset=0):
+    @staticmethod
+    def facet_counts(fields=None):
+        """Aggregation counts for browsable fields
+        
+        With settings.FACET_SNAPSHOT counts come from the in-memory facet
+        snapshot.  Otherwise counts for all PAGE_AGG_FIELDS are fetched in one
+        aggregations-only request and cached until the article index
+        generation changes.
+        
+        @param fields: list of Page fieldnames (default all PAGE_AGG_FIELDS)
+        @returns: dict {fieldname: [{'key': term, 'doc_count': int}, ...]}
+        """
+        if not fields:
+            fields = PAGE_AGG_FIELDS.keys()
+        if settings.FACET_SNAPSHOT:
+            snapshot = facets.SNAPSHOTS.current()
+            return {field: snapshot.counts(field) for field in fields}
+        key = u'encyc-rg:facets:%s' % generation.ARTICLES.current()
+        data = cache.get(key)
+        if data is None:
+            data = search.facet_counts(DOCSTORE, list(PAGE_AGG_FIELDS.keys()))
+            cache.set(key, data, settings.ELASTICSEARCH_FACETS_TIMEOUT)
+        return {field: data[field] for field in fields}
+    
+    def browse_field_objects(field, value, limit=settings.PAGE_SIZE, offset=0, fields=None):
         """Return objects for specified field and aggregations bucket
         
         Get objects for the specified aggregations bucket.
         Example: Objects for field 'media-type' (model_field rg_rgmediatype)
         aggregations bucket "short stories".
         
+        With settings.FACET_SNAPSHOT objects come from the in-memory facet
+        snapshot, in title order.
+        
         @param field: str Human-friendly field name from URI e.g. 'media-type'
         @param value: str Value of field e.g. 'books'
-        @param request
-        @returns: search.SearchResults
+        @param fields: list Only these fields (see source_fields)
+        @returns: search.SearchResults or facets.SnapshotResults
         """
         model_field = MEDIATYPE_URLSTUBS[field]
         if model_field not in PAGE_SEARCH_FIELDS:
             raise Exception('Bad model field "%s".' % model_field)
+        if settings.FACET_SNAPSHOT:
+            snapshot = facets.SNAPSHOTS.current()
+            return snapshot.results(
+                snapshot.ordinals(model_field, value), limit, offset
+            )
         params = {
             model_field: value,
         }
@@ -1039,9 +1088,32 @@ class Page(repo_models.Page):
             fields=PAGE_SEARCH_FIELDS,
             fields_nested={},
             fields_agg={},
+            source_fields=source_fields('article', fields),
         )
         return searcher.execute(limit, offset)
     
+    @staticmethod
+    def browse_filter(filters, operator='or', limit=settings.PAGE_SIZE, offset=0):
+        """Return objects matching a combination of facet terms
+        
+        Answered from the in-memory facet snapshot, in title order.
+        Fields are ANDed; terms within a field are ORed, or ANDed if
+        operator is 'and'.
+        Example: books AND (Grades 6-8 OR Grades 9-12) AND Widely available.
+        
+        @param filters: dict {fieldname: [term, ...]} see facets.filters_from_query
+        @param operator: str 'or' or 'and'
+        @param limit: int
+        @param offset: int
+        @returns: facets.SnapshotResults
+        """
+        snapshot = facets.SNAPSHOTS.current()
+        results = snapshot.results(
+            facets.Ordinals(snapshot.select(filters, operator)), limit, offset
+        )
+        results.query = {'filters': filters, 'operator': operator}
+        return results
+    
     def topics(self):
         """List of DDR topics associated with this page.
         
@@ -1101,6 +1173,15 @@ SOURCE_LIST_FIELDS = [
     'img_path',
 ]
 
+# Source fields shown on article pages (not e.g. transcript)
+ARTICLE_SOURCE_FIELDS = [
+    'encyclopedia_id',
+    'headword',
+    'img_path',
+    'caption',
+    'courtesy',
+]
+
 class Source(repo_models.Source):
     
     def absolute_url(self):
@@ -1116,12 +1197,53 @@ class Source(repo_models.Source):
         return '/'.join([settings.ENCYCLOPEDIA_URL, 'sources', self.encyclopedia_id])
 
     @staticmethod
-    def get(title):
+    def get(title, fields=None):
+        """
+        @param title: str encyclopedia_id
+        @param fields: list Only these fields e.g. ARTICLE_SOURCE_FIELDS
+        @returns: Source
+        """
         ds = DOCSTORE
+        kwargs = {}
+        if fields:
+            kwargs['_source_includes'] = fields
         return super(Source, Source).get(
-            title, index=ds.index_name('source'), using=ds.es
+            title, index=ds.index_name('source'), using=ds.es, **kwargs
         )
 
+    @staticmethod
+    def get_many(titles):
+        """Get several Sources in one request
+        
+        @param titles: list of encyclopedia_ids
+        @returns: list of Source objects, None where there is no such Source
+        """
+        if not titles:
+            return []
+        ds = DOCSTORE
+        return Source.mget(
+            titles, index=ds.index_name('source'), using=ds.es, missing='none'
+        )
+
+    @staticmethod
+    def for_headword(url_title, size=100, fields=None):
+        """Sources whose headword is the given article
+        
+        Does not need the article's source_ids, so it can run at the same
+        time as Page.get (see views.article).
+        
+        @param url_title: str Page url_title
+        @param size: int
+        @param fields: list Only these fields e.g. ARTICLE_SOURCE_FIELDS
+        @returns: list of Source objects
+        """
+        ds = DOCSTORE
+        s = search.Search(using=ds.es, index=ds.index_name('source'))
+        s = s.doc_type(Source).filter('term', headword=url_title)
+        if fields:
+            s = s.source(fields)
+        return list(s.extra(size=size).execute())
+
     @staticmethod
     def search():
         """Source Search
@@ -1142,15 +1264,8 @@ class Source(repo_models.Source):
         data['id'] = hit.encyclopedia_id
         data['doctype'] = hit.meta.doc_type
         data['links'] = {}
-        data['links']['html'] = api_reverse(
-            'rg-source',
-            args=([hit.encyclopedia_id]),
-            request=request,
-        )
-        data['links']['json'] = api_reverse(
-            'rg-api-source', args=([hit.encyclopedia_id]),
-            request=request,
-        )
+        data['links']['html'] = links.url('rg-source', hit.encyclopedia_id, request=request)
+        data['links']['json'] = links.url('rg-api-source', hit.encyclopedia_id, request=request)
         return data
 
     def to_dict_list(self, request=None):
@@ -1163,16 +1278,8 @@ class Source(repo_models.Source):
         data['id'] = self.encyclopedia_id
         data['doctype'] = u'sources'
         data['links'] = OrderedDict()
-        data['links']['html'] = api_reverse(
-            'rg-source',
-            args=([self.encyclopedia_id]),
-            request=request,
-        )
-        data['links']['json'] = api_reverse(
-            'rg-api-source',
-            args=([self.encyclopedia_id]),
-            request=request,
-        )
+        data['links']['html'] = links.url('rg-source', self.encyclopedia_id, request=request)
+        data['links']['json'] = links.url('rg-api-source', self.encyclopedia_id, request=request)
         data['links']['img'] = self.img_url()
         data['links']['encyc'] = self.encyc_url()
         return data
@@ -1215,19 +1322,21 @@ class Source(repo_models.Source):
         return data
     
     def article(self):
+        page = None
         if self.headword:
             try:
-                page = Page.get(self.headword)
+                page = Page.get(self.headword, body=False)
             except docstore.NotFoundError:
-                page = None
+                pass
         return page
     
     @staticmethod
-    def sources(limit=settings.MAX_SIZE, offset=0):
+    def sources(limit=settings.MAX_SIZE, offset=0, fields=None):
         """Returns list of published light Source objects.
         
         @param limit: int
         @param offset: int
+        @param fields: list Only these fields (see source_fields)
         @returns: SearchResults
         """
         searcher = search.Searcher(DOCSTORE)
@@ -1239,6 +1348,8 @@ class Source(repo_models.Source):
             fields=SEARCH_INCLUDE_FIELDS,
             fields_nested=[],
             fields_agg={},
+            source_fields=source_fields('source', fields),
+            published_rg=False,
         )
         return searcher.execute(limit, offset)
     
@@ -1290,3 +1401,113 @@ DOCTYPE_CLASS['source'] = Source
 DOCTYPE_CLASS['sources'] = Source
 
 SEARCH_LIST_FIELDS = AUTHOR_LIST_FIELDS + PAGE_LIST_FIELDS + SOURCE_LIST_FIELDS
+
+# _source fields for lists of each model; the formatters use nothing else
+LIST_FIELDS = {
+    'article': PAGE_LIST_FIELDS,
+    'author': AUTHOR_LIST_FIELDS,
+    'source': SOURCE_LIST_FIELDS,
+}
+# fields the formatters cannot do without
+REQUIRED_FIELDS = {
+    'article': ['url_title', 'title', 'description'],
+    'author': ['url_title'],
+    'source': ['encyclopedia_id'],
+}
+
+def source_fields(model, fields=None):
+    """_source fields to fetch for a list
+    
+    @param model: str 'article', 'author', 'source'
+    @param fields: list Requested fields, or None for all LIST_FIELDS
+    @returns: list
+    """
+    if not fields:
+        return LIST_FIELDS[model]
+    return REQUIRED_FIELDS[model] + [
+        field for field in fields if field not in REQUIRED_FIELDS[model]
+    ]
+
+
+# Cursor pagination: sort order (last field unique) and fields for each model
+CURSOR_SORT = {
+    'article': ['title_sort', 'url_title'],
+    'author': ['title_sort', 'url_title'],
+    'source': ['encyclopedia_id'],
+}
+def cursor_results(model, limit, cursor=None, filters=None, fields=None):
+    """One page of Pages, Authors, or Sources for cursor (deep) pagination
+    
+    See search.cursor_search.  Published RG Pages only; published_rg is
+    not an Author or Source field (same as Author.authors, Source.sources).
+    
+    @param model: str 'article', 'author', 'source'
+    @param limit: int
+    @param cursor: str Cursor from previous page or None
+    @param filters: dict {fieldname: value} additional term filters
+    @param fields: list Only these fields (see source_fields)
+    @returns: (hits, total, next_cursor)
+    """
+    filters = dict(filters or {})
+    if model == 'article':
+        filters['published_rg'] = True
+    return search.cursor_search(
+        DOCSTORE, model, CURSOR_SORT[model], filters, source_fields(model, fields),
+        limit, cursor, settings.API_CURSOR_KEEPALIVE,
+        pit_key=generation.CONTENT.current(),
+    )
+
+
+# Change feed: every document in modified order.  _shard_doc breaks ties
+# within the point-in-time (see search.cursor_search).
+CHANGES_MODELS = ['article', 'author', 'source']
+CHANGES_SORT = ['modified', '_shard_doc']
+CHANGES_FIELDS = ['modified']
+
+def change_results(limit, cursor=None, since=None):
+    """One page of Pages, Authors, and Sources modified at or after since
+    
+    Pages that are not published in the RG are left out.  published_rg
+    is an article field, so documents without it (Authors, Sources) are
+    kept.  There is no record of whether an unpublished Page was ever in
+    the RG, so no deletion tombstones are given.
+    
+    @param limit: int
+    @param cursor: str Cursor from previous page or None
+    @param since: str ISO 8601 date or datetime (as from .isoformat()), or
+        None for all
+    @returns: (hits, total, next_cursor)
+    """
+    ranges = {}
+    if since:
+        ranges['modified'] = {'gte': since}
+    return search.cursor_search(
+        DOCSTORE, CHANGES_MODELS, CHANGES_SORT, {}, CHANGES_FIELDS,
+        limit, cursor, settings.API_CURSOR_KEEPALIVE, ranges,
+        pit_key=generation.CONTENT.current(),
+        excludes={'published_rg': False},
+    )
+
+def format_change(hit, request=None):
+    """Change feed item: id, model, modified, and links
+    
+    @param hit: elasticsearch_dsl.response.Hit from change_results
+    @param request
+    @returns: OrderedDict, or None if the hit is not from a CHANGES_MODELS index
+    """
+    # hit.meta.index may be the index behind an alias e.g. encycarticle-1
+    model = next((
+        model for model in CHANGES_MODELS
+        if hit.meta.index.startswith(DOCSTORE.index_name(model))
+    ), None)
+    if not model:
+        logger.warning('change feed: unknown index %s' % hit.meta.index)
+        return None
+    d = OrderedDict()
+    d['id'] = hit.meta.id
+    d['model'] = model
+    d['modified'] = getattr(hit, 'modified', None)
+    d['links'] = OrderedDict()
+    d['links']['html'] = links.url('rg-%s' % model, hit.meta.id, request=request)
+    d['links']['json'] = links.url('rg-api-%s' % model, hit.meta.id, request=request)
+    return d
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from django.core.paginator import Paginator
+
+
+class ResultsPaginator(Paginator):
+    """Paginator for one page of search results
+
+    Django's Paginator slices a list holding every item in the result set,
+    so views used to pad the current page with a placeholder for each of the
+    other hits.  This paginator takes the total hit count and only the
+    objects on the current page, and exposes the same page/paginator API to
+    templates (e.g. bootstrap_paginate).
+    """
+
+    def __init__(self, objects, total, per_page, this_page, **kwargs):
+        """
+        @param objects: list Objects on the current page
+        @param total: int Number of items in the entire result set
+        @param per_page: int
+        @param this_page: int Current page number (1-indexed)
+        """
+        super().__init__([], per_page, **kwargs)
+        self.objects = objects
+        self.total = int(total)
+        self.this_page = int(this_page)
+
+    @classmethod
+    def from_results(cls, results, request, format_functions):
+        """Paginator for a SearchResults or SnapshotResults
+
+        @param results: search.SearchResults
+        @param request: django.http.request.HttpRequest
+        @param format_functions: dict e.g. models.FORMATTERS
+        @returns: ResultsPaginator
+        """
+        data = results.ordered_dict(
+            request=request,
+            format_functions=format_functions,
+            pad=False,
+        )
+        return cls(
+            data['objects'], data['total'],
+            results.page_size, results.this_page,
+        )
+
+    @property
+    def count(self):
+        return self.total
+
+    def page(self, number):
+        """Return the current Page
+
+        Only the current page's objects are available; asking for any other
+        page is an error.
+        """
+        number = self.validate_number(number)
+        if number != self.this_page:
+            raise ValueError(
+                'Page %s requested but only page %s is loaded' % (
+                    number, self.this_page
+                )
+            )
+        return self._get_page(self.objects, number, self)
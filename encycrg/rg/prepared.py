@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Store of prepared article bodies
+
+Page.prepare() transforms the raw MediaWiki body HTML for display, which is
+the most expensive step in rendering an article.  The result depends only on
+the article revision, so it is stored under (url_title, modified) and each
+revision is transformed once.
+
+Two levels:
+- a bounded per-worker LRU (PREPARED_LRU_SIZE entries)
+- the shared PREPARED_CACHE cache backend (Redis, or FileBasedCache on
+  local disk).  Entries expire after PREPARED_CACHE_TIMEOUT seconds so that
+  Redis can evict superseded revisions.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+logger = logging.getLogger(__name__)
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LRUCache():
+    """Bounded in-process dict that discards the least-recently-used items
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return default
+            return self.data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class PreparedStore():
+    """Prepared body and section HTML for article revisions
+    """
+
+    def __init__(self, alias, timeout, lru_size):
+        """
+        @param alias: str Name of cache in settings.CACHES
+        @param timeout: int Seconds
+        @param lru_size: int Max number of revisions kept in this worker
+        """
+        self.alias = alias
+        self.timeout = timeout
+        self.lru = LRUCache(lru_size)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def key(url_title, modified):
+        """Cache key for an article revision
+
+        url_title is hashed because titles may contain spaces and
+        punctuation that memcached-style backends reject.  The engine name
+        is included because engines format their output differently, and
+        the app version and git commit because a deploy may change an
+        engine's output.
+        """
+        if hasattr(modified, 'isoformat'):
+            modified = modified.isoformat()
+        return 'encyc-rg:prepared:%s:%s:%s:%s' % (
+            hashlib.sha1(
+                ('%s:%s' % (settings.VERSION, settings.GIT_COMMIT)).encode('utf-8')
+            ).hexdigest()[:12],
+            settings.PREPARE_ENGINE,
+            hashlib.sha1(url_title.encode('utf-8')).hexdigest(),
+            modified
+        )
+
+    def get(self, url_title, modified):
+        """
+        @param url_title: str
+        @param modified: datetime
+        @returns: dict or None
+        """
+        key = self.key(url_title, modified)
+        data = self.lru.get(key)
+        if data is None:
+            data = self.cache.get(key)
+            if data is not None:
+                self.lru.set(key, data)
+        return data
+
+    def set(self, url_title, modified, data):
+        """
+        @param url_title: str
+        @param modified: datetime
+        @param data: dict
+        """
+        key = self.key(url_title, modified)
+        self.lru.set(key, data)
+        self.cache.set(key, data, self.timeout)
+
+
+STORE = PreparedStore(
+    settings.PREPARED_CACHE,
+    settings.PREPARED_CACHE_TIMEOUT,
+    settings.PREPARED_LRU_SIZE,
+)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Templates for each Resource Guide mediatype
+
+Article pages, article list items, and databoxes can each have a template
+specific to a mediatype (e.g. rg/article-list-books.html), falling back to
+a default.  TemplateRegistry resolves each (kind, mediatype) once per
+process, the first time it is needed, and keeps the compiled Template.
+Mediatypes are not listed in advance, so nothing is looked up in the
+docstore.
+
+hits and misses count lookups served from the registry and lookups that
+had to resolve a template.  After warm-up, misses should stop growing;
+see views.stats.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+import threading
+
+from django.template import loader
+
+
+# mediatype: databox name (NOTE: mediatype label MAY NOT MATCH databox name!)
+DATABOXES = {
+    'books': 'databox-Books',
+    'articles': 'databox-Articles',
+    'short stories': 'databox-Articles',
+    'essays': 'databox-Articles',
+    'films': 'databox-Films',
+    'plays': 'databox-Plays',
+    'exhibitions': 'databox-Exhibitions',
+    'websites': 'databox-Websites',
+}
+
+def databox_id(mediatype):
+    """Name of the databox for a mediatype, or None
+    """
+    return DATABOXES.get(mediatype)
+
+def template_names(kind, mediatype):
+    """Candidate template names, most specific first
+
+    @param kind: str 'article', 'list', 'databox'
+    @param mediatype: str e.g. 'books' or '' for none
+    @returns: list
+    """
+    specific = None
+    if kind == 'article':
+        default = 'rg/article.html'
+        if mediatype:
+            specific = 'rg/article-%s.html' % mediatype
+    elif kind == 'list':
+        default = 'rg/article-list.html'
+        if mediatype:
+            specific = 'rg/article-list-%s.html' % mediatype
+    elif kind == 'databox':
+        default = 'rg/databox-default.html'
+        if databox_id(mediatype):
+            specific = 'rg/%s.html' % databox_id(mediatype)
+    else:
+        raise ValueError('Unknown template kind "%s"' % kind)
+    return [name for name in [specific, default] if name]
+
+
+class TemplateRegistry():
+    """Compiled templates keyed by (kind, mediatype)
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+
+    def get(self, kind, mediatype):
+        """
+        @param kind: str 'article', 'list', 'databox'
+        @param mediatype: str e.g. 'books'
+        @returns: django.template.backends.django.Template
+        """
+        key = (kind, mediatype or '')
+        t = self.templates.get(key)
+        if t is not None:
+            self._count(True)
+            return t
+        self._count(False)
+        with self._lock:
+            t = self.templates.get(key)
+            if t is None:
+                names = template_names(kind, mediatype or '')
+                logger.debug('resolving %s template for "%s"' % key)
+                t = loader.select_template(names)
+                self.templates[key] = t
+        return t
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        return {
+            'templates': len(self.templates),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            self.templates = {}
+
+
+REGISTRY = TemplateRegistry()
@@ -1,3 +1,11 @@
+import base64
+import json
+import threading
+import time
+
+from elasticsearch.exceptions import NotFoundError, RequestError
+from elasticsearch_dsl import Search
+
 from elastictools import search
 
 
@@ -16,9 +24,255 @@ class Searcher(search.Searcher):
         fields_nested,     # SEARCH_NESTED_FIELDS
         fields_agg,        # SEARCH_AGG_FIELDS
         wildcards=False,
+        source_fields=None,  # models.LIST_FIELDS[model]
+        published_rg=True,
     ):
-        params['published_rg'] = True  # only show ResourceGuide items
-        return super().prepare(
+        """
+        source_fields, if given, are the only _source fields returned
+        (fields may include e.g. body, which is searched but not listed).
+        published_rg is an article field; pass False for authors and sources.
+        """
+        if published_rg:
+            params['published_rg'] = True  # only show ResourceGuide items
+        prepared = super().prepare(
             params, params_whitelist, search_models, sort,
             fields, fields_nested, fields_agg, wildcards,
         )
+        if source_fields:
+            self.s = self.s.source(source_fields)
+        return prepared
+
+
+def scan_fields(ds, model, fields, published_rg=False):
+    """Iterate over every document in an index, fetching only the named fields
+
+    Uses the scroll API so memory does not grow with the size of the index.
+
+    @param ds: elastictools.docstore.Docstore
+    @param model: str 'article', 'author', 'source'
+    @param fields: list of _source fields
+    @param published_rg: bool Only ResourceGuide items
+    @returns: generator of dicts
+    """
+    s = Search(using=ds.es, index=ds.index_name(model)).source(fields)
+    if published_rg:
+        s = s.filter('term', published_rg=True)
+    for hit in s.scan():
+        yield hit.to_dict()
+
+def terms_fields(ds, model, field, values, fields, sort=None, published_rg=False):
+    """Documents whose field matches any of the values, in one request
+
+    @param ds: elastictools.docstore.Docstore
+    @param model: str 'article', 'author', 'source'
+    @param field: str Keyword field e.g. 'url_title'
+    @param values: list
+    @param fields: list of _source fields
+    @param sort: list of fields
+    @param published_rg: bool Only ResourceGuide items
+    @returns: list of elasticsearch_dsl.response.hit.Hit
+    """
+    s = Search(using=ds.es, index=ds.index_name(model)).source(fields)
+    s = s.filter('terms', **{field: values})
+    if published_rg:
+        s = s.filter('term', published_rg=True)
+    if sort:
+        s = s.sort(*sort)
+    s = s.extra(size=len(values))
+    return list(s.execute())
+
+def get_fields(ds, model, document_id, fields):
+    """Get only the named fields of one document
+
+    @param ds: elastictools.docstore.Docstore
+    @param model: str 'article', 'author', 'source'
+    @param document_id: str
+    @param fields: list of _source fields
+    @returns: dict, or None if there is no such document
+    """
+    try:
+        response = ds.es.get(
+            index=ds.index_name(model), id=document_id, _source_includes=fields
+        )
+    except NotFoundError:
+        return None
+    return response['_source']
+
+def index_stamp(ds, model):
+    """Cheap fingerprint of an index: document count and newest modified
+
+    Changes whenever a document is added, removed, or re-published.
+
+    @param ds: elastictools.docstore.Docstore
+    @param model: str 'article', 'author', 'source'
+    @returns: str
+    """
+    s = Search(using=ds.es, index=ds.index_name(model)).extra(
+        size=0, track_total_hits=True
+    )
+    s.aggs.metric('modified', 'max', field='modified')
+    response = s.execute()
+    return '%s-%s' % (
+        response.hits.total.value,
+        int(response.aggregations.modified.value or 0)
+    )
+
+def facet_counts(ds, fields, size=1000):
+    """Number of published RG articles for each term of the given fields
+
+    Sends a size=0 request with only terms aggregations; no hits are
+    returned.  Buckets have the same shape as SearchResults.aggregations.
+
+    @param ds: elastictools.docstore.Docstore
+    @param fields: list of Page fieldnames e.g. ['rg_rgmediatype']
+    @param size: int Max number of buckets per field
+    @returns: dict {fieldname: [{'key': term, 'doc_count': int}, ...]}
+    """
+    s = Search(using=ds.es, index=ds.index_name('article')).extra(size=0)
+    s = s.filter('term', published_rg=True)
+    for field in fields:
+        s.aggs.bucket(field, 'terms', field=field, size=size)
+    response = s.execute()
+    return {
+        field: [
+            {'key': bucket.key, 'doc_count': bucket.doc_count}
+            for bucket in response.aggregations[field].buckets
+        ]
+        for field in fields
+    }
+
+
+def encode_cursor(state):
+    """Opaque URL-safe cursor string from a dict
+    """
+    text = json.dumps(state, separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Dict from a cursor string; raises ValueError if cursor is garbled
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, UnicodeError, ValueError) as err:
+        raise ValueError('Bad cursor: %s' % err)
+    if not isinstance(state, dict):
+        raise ValueError('Bad cursor')
+    return state
+
+# (index names, pit_key): (PIT id, monotonic time after which not reused)
+PITS = {}
+_pits_lock = threading.Lock()
+
+def keep_alive_seconds(keep_alive):
+    """Seconds in an Elasticsearch time value e.g. '10m'
+    """
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if keep_alive[-1:] in units:
+        return int(keep_alive[:-1]) * units[keep_alive[-1]]
+    return int(keep_alive)
+
+def shared_pit(ds, index, pit_key, keep_alive):
+    """Point-in-time for new walks of index, shared while it is young
+
+    Walks that start within half of keep_alive of each other share a PIT,
+    so clients that never finish a walk can't pile up open PITs in the
+    cluster.  PITs are never closed here (another walk may be using one);
+    each expires keep_alive after the last page that used it.
+
+    @param ds: elastictools.docstore.Docstore
+    @param index: str Comma-separated index names
+    @param pit_key: str Open a new PIT when this changes e.g. generation
+    @param keep_alive: str
+    @returns: str PIT id
+    """
+    key = (index, pit_key)
+    with _pits_lock:
+        now = time.monotonic()
+        pit,reuse_until = PITS.get(key, (None, 0))
+        if pit and now < reuse_until:
+            return pit
+        for old in [k for k in PITS if k[0] == index]:
+            del PITS[old]
+        pit = ds.es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+        PITS[key] = (pit, now + keep_alive_seconds(keep_alive) / 2)
+        return pit
+
+def _check_cursor(state, sort):
+    """Raise ValueError unless state looks like one of our cursors
+    """
+    pit = state.get('pit')
+    after = state.get('after')
+    if pit is not None and not isinstance(pit, str):
+        raise ValueError('Bad cursor')
+    if after is not None and not (
+            isinstance(after, list)
+            and len(after) == len(sort)
+            and all(isinstance(value, (str, int, float)) for value in after)):
+        raise ValueError('Bad cursor')
+
+def cursor_search(ds, model, sort, filters, fields, limit, cursor=None, keep_alive='10m', ranges=None, pit_key='', excludes=None):
+    """One page of documents in sort order, continuing from a cursor
+
+    Uses a point-in-time (PIT) so that every page of a walk sees the index
+    as it was when the walk started, and pages with search_after so that
+    each page costs the same regardless of depth.  New walks share a PIT
+    (see shared_pit).  The cursor holds the PIT id and the sort values of
+    the last hit.  The PIT expires keep_alive after its last use
+    (elasticsearch.NotFoundError on the next page).
+
+    @param ds: elastictools.docstore.Docstore
+    @param model: str 'article', 'author', 'source', or a list of them
+    @param sort: list of fields; last must be unique e.g. ['title_sort', 'url_title']
+    @param filters: dict {fieldname: value} term filters
+    @param fields: list of _source fields
+    @param limit: int 1 to ELASTICSEARCH_MAX_SIZE
+    @param cursor: str Cursor from the previous page, or None for first page
+    @param keep_alive: str PIT lifetime between pages
+    @param ranges: dict {fieldname: {'gte': value}} range filters
+    @param pit_key: str New walks get a new PIT when this changes
+    @param excludes: dict {fieldname: value} term filters that must not match
+    @returns: (hits, total, next_cursor) next_cursor is None on the last page
+    @raises: ValueError if cursor or limit is bad
+    """
+    if not isinstance(limit, int) or limit < 1:
+        raise ValueError('Bad limit')
+    state = decode_cursor(cursor) if cursor else {}
+    _check_cursor(state, sort)
+    pit = state.get('pit')
+    if not pit:
+        if isinstance(model, str):
+            model = [model]
+        pit = shared_pit(
+            ds, ','.join(ds.index_name(m) for m in model), pit_key, keep_alive
+        )
+    s = Search(using=ds.es).extra(
+        pit={'id': pit, 'keep_alive': keep_alive},
+        size=limit,
+        track_total_hits=True,
+    )
+    for fieldname,value in filters.items():
+        s = s.filter('term', **{fieldname: value})
+    for fieldname,value in (ranges or {}).items():
+        s = s.filter('range', **{fieldname: value})
+    for fieldname,value in (excludes or {}).items():
+        s = s.exclude('term', **{fieldname: value})
+    s = s.sort(*sort).source(fields)
+    if state.get('after'):
+        s = s.extra(search_after=state['after'])
+    try:
+        response = s.execute()
+    except RequestError as err:
+        if state:
+            # e.g. a cursor whose sort values don't fit the fields
+            raise ValueError('Bad cursor: %s' % err)
+        raise
+    hits = list(response)
+    pit = getattr(response, 'pit_id', pit)
+    next_cursor = None
+    if hits and len(hits) == limit:
+        next_cursor = encode_cursor({
+            'pit': pit,
+            'after': list(hits[-1].meta.sort),
+        })
+    return hits, response.hits.total.value, next_cursor
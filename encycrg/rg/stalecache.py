@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Stale-while-revalidate page cache for expensive views
+
+generation.cache_page misses on every page at once when the content
+generation changes, and each worker then rebuilds the same page in parallel.
+That is fine for article pages, but not for views that read every document
+(the article, author and source lists).
+
+Here, pages are cached by URL together with the generation they were built
+from.  When the generation changes, the entry becomes stale but is not
+dropped:
+
+- one request, the holder of a lock in the shared cache (cache.add, i.e.
+  Redis SET NX), rebuilds the page;
+- meanwhile every other request gets the stale copy;
+- if there is no copy yet, other requests wait for the lock holder for up
+  to CACHE_LOCK_TIMEOUT seconds.
+
+Within a worker, concurrent requests for the same URL also share one
+computation (SingleFlight), so they don't each hit the cache for the lock.
+
+Keys are built like Django's cache middleware (get_cache_key and
+learn_cache_key), so variants of a URL named by the response's Vary header
+(Accept, Cookie, ...) are cached separately.  Until a URL's Vary headers
+have been learned, its lock is keyed on the URL alone.  The lock holds a
+unique token and is only released by its holder.
+"""
+
+import functools
+import hashlib
+import logging
+logger = logging.getLogger(__name__)
+import pickle
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_cache_key, learn_cache_key
+from django.utils.cache import patch_cache_control
+
+from . import generation
+
+
+class SingleFlight():
+    """Run a function once for concurrent callers with the same key
+
+    >>> flight = SingleFlight()
+    >>> flight.do('key', expensive)  # other threads calling with 'key' wait
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        @param key: str
+        @param fn: function with no arguments
+        @returns: result of fn (callers that waited get the same object)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event()}
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as err:
+            call['error'] = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+
+FLIGHTS = SingleFlight()
+
+POLL_INTERVAL = 0.1  # seconds
+
+
+KEY_PREFIX = 'encyc-rg:swr'
+
+
+def entry_key(request):
+    """Cache key for the variant of the page this request wants
+
+    @returns: str, or None if the URL's Vary headers are not known yet
+    """
+    return get_cache_key(request, KEY_PREFIX, 'GET', cache=cache)
+
+def lock_key(request, key):
+    if key is None:
+        url = request.build_absolute_uri()
+        key = '%s:url:%s' % (KEY_PREFIX, hashlib.sha1(url.encode('utf-8')).hexdigest())
+    return '%s:lock' % key
+
+def cache_page(view):
+    """Cache a view's 200 responses, refreshing stale copies in one place
+
+    Browsers get max-age=CACHE_TIMEOUT, as with generation.cache_page.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = entry_key(request)
+        prefix = generation.key_prefix()
+        entry = cache.get(key) if key else None
+        if entry and entry[0] == prefix:
+            return entry[1]
+        lock = lock_key(request, key)
+        response = FLIGHTS.do(
+            lock, lambda: _refresh(key, lock, prefix, entry, view, request, args, kwargs)
+        )
+        # requests in the same flight get the same object; middleware may
+        # modify it, so each gets its own copy
+        return pickle.loads(pickle.dumps(response, pickle.HIGHEST_PROTOCOL))
+    return wrapper
+
+def _refresh(key, lock, prefix, entry, view, request, args, kwargs):
+    """Rebuild the page if we get the lock, else return the stale or new copy
+    """
+    token = uuid.uuid4().hex
+    locked = cache.add(lock, token, settings.CACHE_LOCK_TIMEOUT)
+    if not locked:
+        if entry:
+            return entry[1]
+        # nothing to serve: wait for the lock holder
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            key = key or entry_key(request)
+            entry = cache.get(key) if key else None
+            if entry:
+                return entry[1]
+        logger.warning('gave up waiting for %s' % lock)
+    try:
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, max_age=settings.CACHE_TIMEOUT)
+        if response.status_code == 200:
+            key = learn_cache_key(
+                request, response, settings.GENERATION_CACHE_TIMEOUT,
+                KEY_PREFIX, cache=cache
+            )
+            cache.set(key, (prefix, response), settings.GENERATION_CACHE_TIMEOUT)
+        return response
+    finally:
+        # the lock may have expired and been taken by another worker
+        if locked and cache.get(lock) == token:
+            cache.delete(lock)
@@ -4,36 +4,20 @@ logger = logging.getLogger(__name__)
 from django import template
 register = template.Library()
 
-from rg import models
-
-def load_templates(default):
-    logger.info('loading templates')
-    tt = {}
-    default = template.loader.get_template('rg/article-list.html')
-    for mediatype in models.Page.mediatypes():
-        try:
-            tt[mediatype] = template.loader.get_template('rg/article-list-%s.html' % mediatype)
-        except:
-            tt[mediatype] = default
-    return tt
-
-DEFAULT_ARTICLE_LIST_TEMPLATE = template.loader.get_template('rg/article-list.html')
-MEDIATYPE_TEMPLATES = load_templates(DEFAULT_ARTICLE_LIST_TEMPLATE)
+from rg import cards
+from rg import registry
 
 @register.simple_tag
 def article(article):
     """Page dict
     """
-    mediatype = article.get('rg_rgmediatype', [])
-    if mediatype:
-        t = MEDIATYPE_TEMPLATES.get(mediatype[0], DEFAULT_ARTICLE_LIST_TEMPLATE)
-    else:
-        t = DEFAULT_ARTICLE_LIST_TEMPLATE
-    c = {
-        'article': article,
-        'fields': models.FACET_FIELDS,
-    }
-    return t.render(c)
+    return cards.render_card(article)
+
+@register.simple_tag
+def article_cards(articles):
+    """List of Page dicts, with cached cards
+    """
+    return cards.render_cards(list(articles))
 
 @register.inclusion_tag('rg/availabilitylevel-tag.html')
 def availabilitylevel(rawlevel):
@@ -63,24 +47,10 @@ def databox(context):
     
     NOTE: mediatype_label MAY NOT MARCH databox_name!
     """
-    DATABOXES = [
-            ('books', 'databox-Books'), 
-            ('articles', 'databox-Articles'), 
-            ('short stories', 'databox-Articles'), 
-            ('essays', 'databox-Articles'), 
-            ('films', 'databox-Films'), 
-            ('plays', 'databox-Plays'), 
-            ('exhibitions', 'databox-Exhibitions'), 
-            ('websites', 'databox-Websites')
-    ]
-
-    databox_id = dict(DATABOXES)[context['article']['rg_rgmediatype'][0]]
-    template_name = "rg/{}.html".format(databox_id)
-    try:
-        t = template.loader.get_template(template_name)
-    except:
-        t = template.loader.get_template('rg/databox-default.html')
+    mediatype = context['article']['rg_rgmediatype'][0]
+    databox_id = registry.databox_id(mediatype)
+    t = registry.REGISTRY.get('databox', mediatype)
     return t.render({
         'databox': context['article']['databoxes'].get(databox_id, {}),
-        'template_name': template_name,
+        'template_name': t.template.name,
     })
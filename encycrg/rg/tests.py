@@ -1,6 +1,38 @@
-from django.test import TestCase
+import asyncio
+from html.parser import HTMLParser
+import json
+import socket
+import threading
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 
+from . import api
+from . import asyncstore
+from . import asyncviews
+from . import cards
+from . import conditional
+from . import context_processors
+from . import export
+from . import facets
+from . import fetch
+from . import generation
+from . import htmlprep
+from . import links
+from . import pagination
+from . import prepared
+from . import registry
+from . import renderers
+from .management.commands import benchstartup
+from . import search
+from . import stalecache
+from . import tieredcache
+from . import titles
+
 
 class APIView(TestCase):
 
@@ -14,11 +46,35 @@ class APIView(TestCase):
         data = {'offset': 25}
         response = self.client.get(reverse('rg-api-articles'), data)
         assert response.status_code == 200
+        data = {'fields': 'title,modified'}
+        response = self.client.get(reverse('rg-api-articles'), data)
+        assert response.status_code == 200
+        assert set(response.json()['objects'][0]) == {
+            'id', 'model', 'links', 'title', 'modified'
+        }
+        data = {'fields': 'body'}
+        response = self.client.get(reverse('rg-api-articles'), data)
+        assert response.status_code == 400
+
+    def test_articles_ids(self):
+        response = self.client.get(
+            reverse('rg-api-articles'), {'ids': '12-1-A (play),Not A Real Title'}
+        )
+        assert response.status_code == 200
+        objects = response.json()['objects']
+        assert objects[0]['id'] == '12-1-A (play)'
+        assert objects[1] == {'id': 'Not A Real Title', 'detail': 'Not found.'}
 
     def test_article(self):
         assert self.client.get(
             reverse('rg-api-article', args=['12-1-A (play)'])
         ).status_code == 200
+        response = self.client.get(
+            reverse('rg-api-article', args=['12-1-A (play)']),
+            {'fields': 'title,authors'}
+        )
+        assert 'body' not in response.json()
+        assert response.json()['authors']
 
     def test_authors(self):
         data = {}
@@ -29,9 +85,15 @@ class APIView(TestCase):
         assert response.status_code == 200
 
     def test_author(self):
-        assert self.client.get(
+        response = self.client.get(
             reverse('rg-api-author', args=['Brian Niiya'])
-        ).status_code == 200
+        )
+        assert response.status_code == 200
+        # only Resource Guide articles, each one resolvable
+        for article in response.data['articles']:
+            assert self.client.get(
+                reverse('rg-api-article', args=[article['title']])
+            ).status_code == 200
 
     def test_sources(self):
         data = {}
@@ -65,6 +127,38 @@ class APIView(TestCase):
         )
         assert r.status_code == 200
 
+    def test_browse_filter(self):
+        r = self.client.get(
+            reverse('rg-api-browse-filter'),
+            {'media-type': 'books', 'genre': ['Art', 'Drama']}
+        )
+        assert r.status_code == 200
+        r = self.client.get(
+            reverse('rg-api-browse-filter'),
+            {'genre': ['Art', 'Drama'], 'operator': 'and', 'limit': 5}
+        )
+        assert r.status_code == 200
+
+    def test_export(self):
+        r = self.client.get(
+            reverse('rg-api-export'),
+            {'models': 'author,source', 'fields': 'url_title,title'}
+        )
+        assert r.status_code == 200
+        lines = b''.join(r.streaming_content).splitlines()
+        assert lines
+        assert json.loads(lines[0])['model'] == 'author'
+        r = self.client.get(reverse('rg-api-export'), {'models': 'bogus'})
+        assert r.status_code == 400
+
+    def test_changes(self):
+        r = self.client.get(reverse('rg-api-changes'), {'since': '2020-01-01'})
+        assert r.status_code == 200
+        modified = [o['modified'] for o in r.json()['objects']]
+        assert modified == sorted(modified)
+        r = self.client.get(reverse('rg-api-changes'), {'since': 'yesterday'})
+        assert r.status_code == 400
+
     def test_search_index(self):
         data = {}
         response = self.client.get(reverse('rg-api-search'), data)
@@ -87,6 +181,55 @@ class APIView(TestCase):
         assert response.status_code == 200
 
 
+class AsyncViews(TestCase):
+    """Async views (settings.ASYNC_VIEWS) called directly
+    """
+
+    async def test_article(self):
+        request = RequestFactory().get(reverse('rg-article', args=['12-1-A (play)']))
+        response = await asyncviews.article(request, '12-1-A (play)')
+        assert response.status_code == 200
+
+    async def test_api_article(self):
+        request = RequestFactory().get('/')
+        response = await asyncviews.api_article(request, '12-1-A (play)')
+        assert response.status_code == 200
+        response = await asyncviews.api_article(request, 'Not A Real Title')
+        assert response.status_code == 404
+        request = RequestFactory().get('/', {'fields': 'title,modified'})
+        response = await asyncviews.api_article(request, '12-1-A (play)')
+        response.render()
+        assert set(json.loads(response.content)) == {
+            'id', 'doctype', 'links', 'title', 'modified'
+        }
+
+
+@override_settings(
+    DOCSTORE_TIMEOUT=5, DOCSTORE_SSL_CERTFILE='', DOCSTORE_PASSWORD='',
+)
+class AsyncClient(SimpleTestCase):
+    """One client per event loop, closed when the loop is
+    """
+
+    def test_closed_with_loop(self):
+        closed = []
+        class FakeES():
+            def __init__(self, **kwargs):
+                pass
+            async def close(self):
+                closed.append(self)
+        async def main():
+            es = asyncstore.client()
+            self.assertIs(asyncstore.client(), es)
+            return es
+        with mock.patch.object(asyncstore, 'AsyncElasticsearch', FakeES):
+            first = asyncio.run(main())
+            second = asyncio.run(main())
+        self.assertIsNot(first, second)
+        self.assertEqual(closed, [first, second])
+        self.assertEqual(asyncstore._clients, {})
+
+
 class WikiPageTitles(TestCase):
     """Test that characters in MediaWiki titles are matched correctly
     """
@@ -95,6 +238,11 @@ class WikiPageTitles(TestCase):
         response = self.client.get(reverse('rg-index'))
         self.assertEqual(response.status_code, 200)
 
+    def test_ready(self):
+        response = self.client.get(reverse('rg-ready'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ready'])
+
     def test_articles(self):
         assert self.client.get(reverse('rg-articles')).status_code == 200
 
@@ -103,16 +251,16 @@ class WikiPageTitles(TestCase):
             reverse('rg-article', args=['12-1-A (play)'])
         ).status_code == 200
 
-    #def test_authors(self):
-    #    assert self.client.get(reverse('rg-authors')).status_code == 200
+    def test_authors(self):
+        assert self.client.get(reverse('rg-authors')).status_code == 200
 
-    #def test_author(self):
-    #    assert self.client.get(
-    #        reverse('rg-author', args=['Brian Niiya'])
-    #    ).status_code == 200
+    def test_author(self):
+        assert self.client.get(
+            reverse('rg-author', args=['Brian Niiya'])
+        ).status_code == 200
 
-    #def test_sources(self):
-    #    assert self.client.get(reverse('rg-sources')).status_code == 200
+    def test_sources(self):
+        assert self.client.get(reverse('rg-sources')).status_code == 200
 
     #def test_source(self):
     #    assert self.client.get(
@@ -132,6 +280,11 @@ class WikiPageTitles(TestCase):
             reverse('rg-browse-fieldvalue', args=['genre', 'Art'])
         ).status_code == 200
 
+    def test_browse_filter(self):
+        assert self.client.get(
+            reverse('rg-browse-filter'), {'media-type': 'books', 'genre': 'Art'}
+        ).status_code == 200
+
     def test_search_index(self):
         data = {}
         response = self.client.get(reverse('rg-search'), data)
@@ -146,3 +299,927 @@ class WikiPageTitles(TestCase):
         data = {'fulltext': 'camp', 'rg_rgmediatype': 'books'}
         response = self.client.get(reverse('rg-search'), data)
         assert response.status_code == 200
+
+
+SAMPLE_SECTIONS = [
+    ('moreinfo', 'For_More_Information'),
+    ('footnotes', 'Footnotes'),
+    ('related', 'Related_articles'),
+]
+
+SAMPLE_DATABOXES = ['rgdatabox-Core|{"mediatype": ["books"]}']
+
+SAMPLE_BODY = """<div id="rgdatabox-CoreDisplay"><table><tr><td>Core</td></tr></table></div>
+<p>A novel by <a class="rg" href="Brian_Niiya">Brian Niiya</a> about
+<a class="notrg" href="/Manzanar/">Manzanar</a> &amp; <b>Tule Lake</b>.<br/>Café</p>
+<div class="toc" id="toc"><ul><li><a href="#Reviews">Reviews</a></li></ul></div>
+<h2>Synopsis<div class="toplink"><a href="#top">top</a></div></h2>
+<p>See <a class="rg" href="Farewell_to_Manzanar/">Farewell to Manzanar</a>.</p>
+<p><img src="Manzanar map.png"/> <a class="rg" href="Café_Society">Café Society</a></p>
+<div class="section" id="For_More_Information"><h2>For More Information</h2>
+<ul><li><a class="notrg" href="Jeanne_Wakatsuki_Houston">Houston</a></li></ul></div>
+tail text
+<div class="section" id="Footnotes"><ol><li>Footnote <i>one</i>.</li></ol></div>
+"""
+
+VOID_ELEMENTS = ['br', 'hr', 'img', 'input', 'meta', 'link']
+
+class Tokens(HTMLParser):
+    """Whitespace-insensitive token stream, for comparing HTML
+    """
+    def __init__(self, html):
+        super().__init__()
+        self.tokens = []
+        self.feed(html)
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        self.tokens.append(('start', tag, sorted(attrs)))
+
+    def handle_endtag(self, tag):
+        if tag not in VOID_ELEMENTS:
+            self.tokens.append(('end', tag))
+
+    def handle_data(self, data):
+        text = ' '.join(data.split())
+        if text:
+            self.tokens.append(('text', text))
+
+
+@override_settings(ENCYCLOPEDIA_URL='https://encyclopedia.densho.org')
+class PrepareBody(SimpleTestCase):
+    """Body transform engines must produce equivalent HTML
+    """
+
+    def prepare(self, engine, body=SAMPLE_BODY):
+        return htmlprep.prepare_body(
+            body, SAMPLE_DATABOXES, SAMPLE_SECTIONS, engine=engine
+        )
+
+    def normalized(self, engine):
+        """Engine output with whitespace normalized, attributes exact
+        """
+        return {
+            key: Tokens(value).tokens
+            for key,value in self.prepare(engine).items()
+        }
+
+    def test_engines_equivalent(self):
+        self.assertEqual(self.normalized('lxml'), self.normalized('bs4'))
+
+    def test_lxml(self):
+        out = self.prepare('lxml')
+        self.assertNotIn('rgdatabox-CoreDisplay', out['body'])
+        self.assertNotIn('toplink', out['body'])
+        self.assertNotIn('id="toc"', out['body'])
+        self.assertNotIn('For_More_Information', out['body'])
+        self.assertIn('tail text', out['body'])
+        # URLs are written as bs4 writes them, not percent-encoded
+        self.assertIn('href="Brian Niiya/"', out['body'])
+        self.assertIn('href="Farewell to Manzanar/"', out['body'])
+        self.assertIn('href="Café Society/"', out['body'])
+        self.assertIn('src="Manzanar map.png"', out['body'])
+        self.assertIn(
+            'href="https://encyclopedia.densho.org/Manzanar/"', out['body']
+        )
+        self.assertIn(
+            'https://encyclopedia.densho.org/Jeanne_Wakatsuki_Houston',
+            out['moreinfo']
+        )
+        self.assertNotIn('related', out)
+
+    def test_store_key(self):
+        key = prepared.PreparedStore.key('Manzanar', '2020-01-01T00:00:00')
+        with override_settings(GIT_COMMIT='0123abc'):
+            self.assertNotEqual(
+                prepared.PreparedStore.key('Manzanar', '2020-01-01T00:00:00'), key
+            )
+
+    def test_lxml_empty(self):
+        self.assertEqual(self.prepare('lxml', body=''), {'body': ''})
+
+
+SNAPSHOT_DOCS = [
+    {'url_title': 'C', 'title_sort': 'c', 'rg_rgmediatype': ['books'],
+     'rg_interestlevel': ['Grades 6-8', 'Grades 9-12'],
+     'rg_availability': 'Widely available'},
+    {'url_title': 'A', 'title_sort': 'a', 'rg_rgmediatype': ['films'],
+     'rg_interestlevel': ['Grades 6-8'],
+     'rg_availability': 'Widely available'},
+    {'url_title': 'B', 'title_sort': 'b', 'rg_rgmediatype': ['books'],
+     'rg_interestlevel': ['Grades 9-12'],
+     'rg_availability': 'Limited'},
+    {'url_title': 'D', 'title_sort': 'd', 'rg_rgmediatype': ['books'],
+     'rg_interestlevel': ['Grades 6-8']},
+]
+
+class FacetSnapshot(SimpleTestCase):
+    """In-memory facet counts and bitset filtering
+    """
+
+    def setUp(self):
+        self.snapshot = facets.FacetSnapshot(
+            'test', SNAPSHOT_DOCS,
+            ['rg_rgmediatype', 'rg_interestlevel', 'rg_availability']
+        )
+
+    def titles(self, filters, operator='or'):
+        return [
+            self.snapshot.docs[n]['url_title']
+            for n in facets.Ordinals(self.snapshot.select(filters, operator))
+        ]
+
+    def test_counts(self):
+        self.assertEqual(
+            self.snapshot.counts('rg_rgmediatype'),
+            [{'key': 'books', 'doc_count': 3}, {'key': 'films', 'doc_count': 1}]
+        )
+        self.assertEqual(list(self.snapshot.ordinals('rg_rgmediatype', 'books')), [1,2,3])
+
+    @override_settings(FACET_SNAPSHOT=True)
+    def test_facet_counts(self):
+        # search form counts come from the snapshot, not Elasticsearch
+        from . import models
+        with mock.patch.object(facets.SNAPSHOTS, 'current', return_value=self.snapshot), \
+             mock.patch.object(models.search, 'facet_counts') as facet_counts:
+            counts = models.Page.facet_counts(['rg_rgmediatype', 'rg_availability'])
+        facet_counts.assert_not_called()
+        self.assertEqual(counts['rg_rgmediatype'], self.snapshot.counts('rg_rgmediatype'))
+
+    def test_select(self):
+        self.assertEqual(self.titles({}), ['A', 'B', 'C', 'D'])
+        self.assertEqual(
+            self.titles({
+                'rg_rgmediatype': ['books'],
+                'rg_interestlevel': ['Grades 6-8'],
+                'rg_availability': ['Widely available'],
+            }),
+            ['C']
+        )
+        self.assertEqual(
+            self.titles({'rg_interestlevel': ['Grades 6-8', 'Grades 9-12']}),
+            ['A', 'B', 'C', 'D']
+        )
+        self.assertEqual(
+            self.titles({'rg_interestlevel': ['Grades 6-8', 'Grades 9-12']}, 'and'),
+            ['C']
+        )
+        self.assertEqual(self.titles({'rg_rgmediatype': ['albums']}), [])
+
+    def test_ordinals_slice(self):
+        ordinals = facets.Ordinals(self.snapshot.select({'rg_rgmediatype': ['books']}))
+        self.assertEqual(len(ordinals), 3)
+        self.assertEqual(ordinals[1:3], [2,3])
+        self.assertEqual(ordinals[5:10], [])
+        # slices match list slicing on a larger, sparse bitset
+        expected = [n for n in range(2000) if n % 7 == 0 or n % 11 == 0]
+        ordinals = facets.Ordinals(facets._bitset(expected))
+        for key in [slice(0, 5), slice(100, 125), slice(250, 400), slice(10, 40, 3)]:
+            self.assertEqual(ordinals[key], expected[key])
+
+    def test_bad_limit_offset(self):
+        ordinals = facets.Ordinals(self.snapshot.select({}))
+        self.assertRaises(ValueError, facets.SnapshotResults, self.snapshot, ordinals, 0, 0)
+        self.assertRaises(ValueError, facets.SnapshotResults, self.snapshot, ordinals, 10, -1)
+        for params in [{'limit': 0}, {'offset': -1}, {'limit': 'x'}]:
+            response = api.browse_filter(RequestFactory().get('/', params))
+            self.assertEqual(response.status_code, 400)
+
+
+class ResultsPaginator(SimpleTestCase):
+    """Paginator holds only the current page but reports the whole set
+    """
+
+    def test_page(self):
+        paginator = pagination.ResultsPaginator(
+            ['a','b','c'], total=53, per_page=25, this_page=3
+        )
+        self.assertEqual(paginator.count, 53)
+        self.assertEqual(paginator.num_pages, 3)
+        page = paginator.page(3)
+        self.assertEqual(list(page.object_list), ['a','b','c'])
+        self.assertEqual(page.number, 3)
+        self.assertTrue(page.has_previous())
+        self.assertFalse(page.has_next())
+        self.assertEqual(page.start_index(), 51)
+        self.assertRaises(ValueError, paginator.page, 2)
+
+    def test_empty(self):
+        paginator = pagination.ResultsPaginator([], total=0, per_page=25, this_page=1)
+        self.assertEqual(list(paginator.page(1).object_list), [])
+
+
+class Cursor(SimpleTestCase):
+    """Cursors round-trip and garbled cursors are rejected
+    """
+
+    def test_roundtrip(self):
+        state = {'pit': 'abc==', 'after': ['manzanar', 'Manzanar']}
+        cursor = search.encode_cursor(state)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(search.decode_cursor(cursor), state)
+
+    def test_garbled(self):
+        self.assertRaises(ValueError, search.decode_cursor, 'not a cursor!')
+        self.assertRaises(ValueError, search.decode_cursor, search.encode_cursor([1]))
+
+    def docstore(self):
+        ds = mock.Mock()
+        ds.index_name = lambda model: 'encyc%s' % model
+        ds.es.open_point_in_time.side_effect = [{'id': 'pit1'}, {'id': 'pit2'}]
+        return ds
+
+    def test_bad_cursor(self):
+        ds = self.docstore()
+        sort = ['title_sort', 'url_title']
+        for cursor in [
+                search.encode_cursor({'pit': 'pit1', 'after': ['a']}),
+                search.encode_cursor({'pit': 'pit1', 'after': [{'a': 1}, 'b']}),
+                search.encode_cursor({'pit': ['pit1']}),
+        ]:
+            self.assertRaises(
+                ValueError, search.cursor_search, ds, 'article', sort, {}, [], 10, cursor
+            )
+        self.assertRaises(
+            ValueError, search.cursor_search, ds, 'article', sort, {}, [], 0
+        )
+        ds.es.open_point_in_time.assert_not_called()
+
+    def test_shared_pit(self):
+        ds = self.docstore()
+        search.PITS.clear()
+        self.assertEqual(search.shared_pit(ds, 'encycarticle', 'a', '10m'), 'pit1')
+        self.assertEqual(search.shared_pit(ds, 'encycarticle', 'a', '10m'), 'pit1')
+        # a new generation gets a new PIT, and the old one is forgotten
+        self.assertEqual(search.shared_pit(ds, 'encycarticle', 'b', '10m'), 'pit2')
+        self.assertEqual(list(search.PITS), [('encycarticle', 'b')])
+        self.assertEqual(search.keep_alive_seconds('10m'), 600)
+
+    def test_bad_limit(self):
+        walk = mock.Mock()
+        for limit in ['x', '0', '-1', '10001']:
+            response = api._cursor_response(
+                RequestFactory().get('/', {'limit': limit}), walk, None
+            )
+            self.assertEqual(response.status_code, 400)
+        walk.assert_not_called()
+
+
+class Export(SimpleTestCase):
+
+    def test_parse_list(self):
+        self.assertEqual(export.parse_list(''), [])
+        self.assertEqual(export.parse_list('title, url_title,'), ['title','url_title'])
+        self.assertRaises(ValueError, export.parse_list, 'article,page', export.EXPORT_MODELS)
+
+    def test_documents(self):
+        # authors and sources have no published_rg field
+        fixtures = {
+            'article': [
+                {'url_title': 'Manzanar', 'published_rg': True},
+                {'url_title': 'Draft', 'published_rg': False},
+            ],
+            'author': [{'url_title': 'Brian Niiya'}],
+            'source': [{'encyclopedia_id': 'en-littletokyousa-1'}],
+        }
+        def scan_fields(ds, model, fields, published_rg=False):
+            for doc in fixtures[model]:
+                if not published_rg or doc.get('published_rg'):
+                    yield dict(doc)
+        with mock.patch.object(export.search, 'scan_fields', scan_fields):
+            docs = list(export.documents())
+        self.assertEqual(
+            [(doc['model'], doc.get('url_title') or doc['encyclopedia_id']) for doc in docs],
+            [
+                ('article', 'Manzanar'),
+                ('author', 'Brian Niiya'),
+                ('source', 'en-littletokyousa-1'),
+            ]
+        )
+
+    def test_ndjson(self):
+        lines = list(export.ndjson([{'title': 'Manzanar'}, {'title': 'Tule Lake'}]))
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(all(line.endswith(b'\n') for line in lines))
+        self.assertEqual(json.loads(lines[1]), {'title': 'Tule Lake'})
+
+
+class FetchPlan(SimpleTestCase):
+
+    def test_concurrent(self):
+        # both lookups must be running at once for either to finish
+        barrier = threading.Barrier(2, timeout=5)
+        def lookup(name):
+            barrier.wait()
+            return name
+        plan = fetch.FetchPlan()
+        plan.add('a', lookup, 'a')
+        plan.add('b', lookup, 'b')
+        self.assertEqual(plan.result('a'), 'a')
+        self.assertEqual(plan.result('b'), 'b')
+
+    def test_exception(self):
+        plan = fetch.FetchPlan()
+        plan.add('bad', int, 'not a number')
+        self.assertRaises(ValueError, plan.result, 'bad')
+
+    def test_article_without_sources(self):
+        import inspect
+        from . import views
+        article = mock.MagicMock(source_ids=[])
+        with mock.patch.object(titles.INDEX, 'is_article', return_value=True), \
+             mock.patch.object(views.fetch.FetchPlan, 'result', return_value=article), \
+             mock.patch.object(views.fetch.FetchPlan, 'add'), \
+             mock.patch.object(views.fetch.FetchPlan, 'cancel') as cancel, \
+             mock.patch.object(views, '_render_article', return_value=HttpResponse()):
+            inspect.unwrap(views.article)(RequestFactory().get('/'), 'Manzanar')
+        cancel.assert_called_once_with()
+
+
+class BenchStartup(SimpleTestCase):
+
+    def test_slowest(self):
+        importtime = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |     rg.search',
+            'import time:      4000 |       4500 |   rg.models',
+            'import time:       300 |       4800 | rg.urls',
+        ])
+        self.assertEqual(
+            benchstartup.slowest(importtime, 2),
+            [(4000, 4500, 'rg.models'), (300, 4800, 'rg.urls')]
+        )
+
+    def test_failed_boot(self):
+        proc = mock.Mock(returncode=1, stderr='')
+        with mock.patch.object(benchstartup.subprocess, 'run', return_value=proc):
+            with self.assertRaises(CommandError):
+                call_command('benchstartup', repeat=1, stdout=mock.Mock())
+
+
+class MediaURLLocalIP(SimpleTestCase):
+
+    def test_failure_not_cached(self):
+        self.addCleanup(setattr, context_processors, '_media_url_local_ip', None)
+        context_processors._media_url_local_ip = None
+        with mock.patch.object(context_processors.socket, 'gethostbyname',
+                               side_effect=socket.gaierror):
+            self.assertEqual(context_processors.media_url_local_ip(), '')
+        with mock.patch.object(context_processors.socket, 'gethostbyname',
+                               return_value='10.0.0.1') as gethostbyname:
+            self.assertEqual(context_processors.media_url_local_ip(), '10.0.0.1')
+            self.assertEqual(context_processors.media_url_local_ip(), '10.0.0.1')
+        self.assertEqual(gethostbyname.call_count, 1)
+
+
+class TemplateRegistry(SimpleTestCase):
+
+    def test_template_names(self):
+        self.assertEqual(
+            registry.template_names('list', 'books'),
+            ['rg/article-list-books.html', 'rg/article-list.html']
+        )
+        self.assertEqual(registry.template_names('article', ''), ['rg/article.html'])
+        self.assertEqual(
+            registry.template_names('databox', 'essays'),
+            ['rg/databox-Articles.html', 'rg/databox-default.html']
+        )
+        self.assertEqual(
+            registry.template_names('databox', 'unknown'), ['rg/databox-default.html']
+        )
+
+    def test_resolved_once(self):
+        reg = registry.TemplateRegistry()
+        t = reg.get('list', 'books')
+        self.assertIs(reg.get('list', 'books'), t)
+        self.assertEqual(reg.get('databox', 'books').template.name, 'rg/databox-Books.html')
+        self.assertEqual(reg.stats(), {'templates': 2, 'hits': 1, 'misses': 2})
+
+    def test_counts_threads(self):
+        reg = registry.TemplateRegistry()
+        reg.get('list', 'books')
+        threads = [
+            threading.Thread(target=lambda: [reg.get('list', 'books') for _ in range(500)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(reg.stats()['hits'], 2000)
+
+    def test_databox_template_name(self):
+        from .templatetags import rg_tags
+        article = {'rg_rgmediatype': ['unknown'], 'databoxes': {}}
+        t = registry.REGISTRY.get('databox', 'unknown')
+        with mock.patch.object(t, 'render') as render:
+            rg_tags.databox({'article': article})
+        context = render.call_args[0][0]
+        self.assertEqual(context['template_name'], 'rg/databox-default.html')
+
+
+@override_settings(
+    CACHES={'cards': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CARD_CACHE='cards',
+)
+class ArticleCards(SimpleTestCase):
+    """Cards are rendered once per article revision
+    """
+    ARTICLE = {
+        'url_title': 'Manzanar', 'title': 'Manzanar', 'description': '',
+        'links': {'html': 'http://testserver/Manzanar/'},
+        'rg_rgmediatype': ['books'], 'modified': '2020-01-01T00:00:00',
+    }
+
+    def test_cached(self):
+        html = cards.render_cards([self.ARTICLE])
+        self.assertEqual(html, cards.render_card(self.ARTICLE))
+        # same revision: cached card even though the dict changed
+        changed = dict(self.ARTICLE, rg_interestlevel=['Changed'])
+        self.assertEqual(cards.render_cards([changed]), html)
+        # new revision: re-rendered
+        changed['modified'] = '2021-01-01T00:00:00'
+        self.assertIn('Changed', cards.render_cards([changed]))
+
+    def test_deploy(self):
+        template = cards.card_template(self.ARTICLE)
+        key = cards.card_key(self.ARTICLE, template)
+        with override_settings(GIT_COMMIT='0123abc'):
+            self.assertNotEqual(cards.card_key(self.ARTICLE, template), key)
+
+
+@override_settings(
+    CACHES={'l2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class TieredCache(SimpleTestCase):
+    """L1 serves repeat reads; invalidate() empties L1 in every worker
+    """
+
+    def worker(self):
+        return tieredcache.TieredCache(
+            'l2', {'OPTIONS': {'L1_TIMEOUT': 60, 'STAMP_INTERVAL': 0}}
+        )
+
+    def setUp(self):
+        patcher = mock.patch.object(generation.CONTENT, 'last', return_value='a')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_l1(self):
+        a,b = self.worker(), self.worker()
+        a.set('key', {'value': 1})
+        self.assertEqual(b.get('key'), {'value': 1})  # from L2
+        b.get('key')['value'] = 2  # callers get copies
+        self.assertEqual(b.get('key'), {'value': 1})
+        self.assertEqual(b.stats()['l1_hits'], 2)
+        self.assertEqual(b.get_many(['key', 'missing']), {'key': {'value': 1}})
+        # changed in L2 behind b's back: b still has L1 copy
+        a.set('key', {'value': 3})
+        self.assertEqual(b.get('key'), {'value': 1})
+        a.invalidate()
+        self.assertEqual(b.get('key'), {'value': 3})
+        a.delete('key')
+        self.assertIsNone(a.get('key'))
+
+    def test_generation(self):
+        a,b = self.worker(), self.worker()
+        with mock.patch.object(generation.CONTENT, 'last', return_value='a'):
+            a.set('key', 1)
+            self.assertEqual(b.get('key'), 1)
+            a.l2.set('key', 2)  # republished; b still has L1 copy
+            self.assertEqual(b.get('key'), 1)
+        with mock.patch.object(generation.CONTENT, 'last', return_value='b'):
+            self.assertEqual(b.get('key'), 2)
+
+    def test_no_poll(self):
+        # reads use the last polled generation and never poll themselves
+        a = self.worker()
+        with mock.patch.object(generation.CONTENT, 'poll') as poll:
+            a.set('key', 1)
+            self.assertEqual(a.get('key'), 1)
+        poll.assert_not_called()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CACHE_TIMEOUT=60,
+)
+class GenerationCache(SimpleTestCase):
+    """Cached pages are kept until the content generation changes
+    """
+
+    def test_cache_page(self):
+        calls = []
+        @generation.cache_page
+        def view(request):
+            calls.append(request.path)
+            return HttpResponse('page %s' % len(calls))
+        request = RequestFactory().get('/browse/')
+        with mock.patch.object(generation.CONTENT, 'poll', return_value='a'):
+            generation.CONTENT.expire()
+            first = view(request)
+            self.assertEqual(view(request).content, first.content)
+            self.assertEqual(len(calls), 1)
+            self.assertIn('max-age=60', first['Cache-Control'])
+        with mock.patch.object(generation.CONTENT, 'poll', return_value='b'):
+            generation.CONTENT.expire()
+            self.assertEqual(view(request).content, b'page 2')
+        generation.CONTENT.expire()
+
+    def test_subsets(self):
+        # one poll of CONTENT serves ARTICLES and the title index
+        token = 'article:3-100|author:2-50|source:1-10'
+        with mock.patch.object(generation.CONTENT, 'poll', return_value=token) as poll:
+            generation.CONTENT.expire()
+            self.assertEqual(generation.ARTICLES.current(), 'article:3-100')
+            self.assertEqual(
+                generation.Subset(generation.CONTENT, ['article', 'author']).current(),
+                'article:3-100|author:2-50'
+            )
+            self.assertEqual(generation.CONTENT.current(), token)
+        self.assertEqual(poll.call_count, 1)
+        generation.CONTENT.expire()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CACHE_TIMEOUT=60,
+)
+class StaleCache(SimpleTestCase):
+    """Stale pages are served while one request rebuilds them
+    """
+
+    def test_single_flight(self):
+        flight = stalecache.SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+        follower.start()
+        release.set()
+        leader.join(); follower.join()
+        self.assertEqual(results, ['result', 'result'])
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_while_revalidate(self):
+        from django.core.cache import cache
+        calls = []
+        @stalecache.cache_page
+        def view(request):
+            calls.append(request.path)
+            return HttpResponse('page %s' % len(calls))
+        request = RequestFactory().get('/articles/')
+        with mock.patch.object(generation.CONTENT, 'poll', return_value='a'):
+            generation.CONTENT.expire()
+            self.assertEqual(view(request).content, b'page 1')
+            self.assertEqual(view(request).content, b'page 1')
+        with mock.patch.object(generation.CONTENT, 'poll', return_value='b'):
+            generation.CONTENT.expire()
+            # another worker is rebuilding: serve stale
+            lock = stalecache.lock_key(request, stalecache.entry_key(request))
+            cache.add(lock, 'other', 60)
+            self.assertEqual(view(request).content, b'page 1')
+            cache.delete(lock)
+            self.assertEqual(view(request).content, b'page 2')
+            self.assertEqual(view(request).content, b'page 2')
+        generation.CONTENT.expire()
+
+    def test_vary(self):
+        @stalecache.cache_page
+        def view(request):
+            response = HttpResponse(request.META.get('HTTP_ACCEPT', ''))
+            response['Vary'] = 'Accept'
+            return response
+        with mock.patch.object(generation.CONTENT, 'poll', return_value='a'):
+            generation.CONTENT.expire()
+            for accept in ['text/html', 'application/json', 'text/html']:
+                request = RequestFactory().get('/sources/', HTTP_ACCEPT=accept)
+                self.assertEqual(view(request).content, accept.encode())
+        generation.CONTENT.expire()
+
+    def test_lock_token(self):
+        from django.core.cache import cache
+        request = RequestFactory().get('/authors/')
+        lock = stalecache.lock_key(request, None)
+        def view(request):
+            # our lock expired and another worker took it
+            cache.set(lock, 'other', 60)
+            return HttpResponse('page')
+        with mock.patch.object(generation.CONTENT, 'poll', return_value='a'):
+            generation.CONTENT.expire()
+            stalecache.cache_page(view)(request)
+        self.assertEqual(cache.get(lock), 'other')
+        cache.delete(lock)
+        generation.CONTENT.expire()
+
+
+class RedirectTable(SimpleTestCase):
+    """Alternate titles redirect only to pages that exist
+    """
+
+    def test_redirect_table(self):
+        table = titles.redirect_table(
+            {'Manzanar', 'Tule Lake', 'tule Lake'}, {'Brian Niiya'}
+        )
+        self.assertEqual(table['Tule_Lake'], reverse('rg-article', args=['Tule Lake']))
+        self.assertEqual(table['tule_Lake'], reverse('rg-article', args=['tule Lake']))
+        self.assertEqual(table['manzanar'], reverse('rg-article', args=['Manzanar']))
+        self.assertEqual(table['Brian Niiya'], reverse('rg-author', args=['Brian Niiya']))
+        # real articles are not redirected
+        self.assertNotIn('tule Lake', table)
+        self.assertNotIn('Manzanar', table)
+        self.assertNotIn('Some_Other_Title', table)
+
+
+class ConditionalGet(SimpleTestCase):
+    """Unchanged documents are answered with 304 before the view runs
+    """
+
+    def test_document(self):
+        calls = []
+        @conditional.document('author')
+        def view(request, url_title):
+            calls.append(url_title)
+            return HttpResponse('author')
+        doc = {'modified': '2020-01-02T03:04:05'}
+        conditional.MODIFIED.clear()
+        with mock.patch.object(conditional.search, 'get_fields', return_value=doc), \
+             mock.patch.object(generation.CONTENT, 'current', return_value='a'):
+            response = view(RequestFactory().get('/authors/A/'), 'A')
+            self.assertEqual(response['Last-Modified'], 'Thu, 02 Jan 2020 03:04:05 GMT')
+            response = view(RequestFactory().get(
+                '/authors/A/', HTTP_IF_NONE_MATCH=response['ETag']
+            ), 'A')
+            self.assertEqual(response.status_code, 304)
+            response = view(RequestFactory().get(
+                '/authors/A/', HTTP_IF_MODIFIED_SINCE='Thu, 02 Jan 2020 03:04:05 GMT'
+            ), 'A')
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(calls, ['A'])
+
+    def test_document_generation(self):
+        @conditional.document('source')
+        def view(request, url_title):
+            return HttpResponse('source')
+        for modified,expected in [
+                ('2020-01-02T03:04:05.1Z', 'Thu, 02 Jan 2020 03:04:05 GMT'),
+                ('2020-01-02T03:04:05.1234+00:00', 'Thu, 02 Jan 2020 03:04:05 GMT'),
+                ('garbled', None),
+        ]:
+            conditional.MODIFIED.clear()
+            with mock.patch.object(conditional.search, 'get_fields',
+                                   return_value={'modified': modified}), \
+                 mock.patch.object(generation.CONTENT, 'current', return_value='a'):
+                response = view(RequestFactory().get('/sources/s/'), 's')
+            self.assertEqual(response.get('Last-Modified'), expected)
+        # republishing another document changes the ETag and Last-Modified
+        conditional.MODIFIED.clear()
+        etags = []
+        for token in ['source:1-0', 'source:2-1609459200000']:
+            with mock.patch.object(conditional.search, 'get_fields',
+                                   return_value={'modified': '2020-01-02T03:04:05'}), \
+                 mock.patch.object(generation.CONTENT, 'current', return_value=token):
+                response = view(RequestFactory().get('/sources/s/'), 's')
+            etags.append(response['ETag'])
+        self.assertNotEqual(etags[0], etags[1])
+        self.assertEqual(response['Last-Modified'], 'Fri, 01 Jan 2021 00:00:00 GMT')
+
+    def test_listing(self):
+        calls = []
+        @conditional.listing
+        def view(request):
+            calls.append(request.method)
+            return HttpResponse('list')
+        with mock.patch.object(generation.CONTENT, 'current', return_value='a'):
+            etag = view(RequestFactory().get('/articles/'))['ETag']
+            self.assertEqual(view(RequestFactory().get(
+                '/articles/', HTTP_IF_NONE_MATCH=etag
+            )).status_code, 304)
+            # cursor pages, ?ids= and POSTs are never answered with 304
+            for request in [
+                    RequestFactory().get('/articles/', {'cursor': ''}, HTTP_IF_NONE_MATCH=etag),
+                    RequestFactory().get('/articles/', {'ids': 'A'}, HTTP_IF_NONE_MATCH=etag),
+                    RequestFactory().post('/articles/', HTTP_IF_NONE_MATCH=etag),
+            ]:
+                response = view(request)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+        self.assertEqual(calls, ['GET', 'GET', 'GET', 'POST'])
+
+
+class Links(SimpleTestCase):
+    """links.url gives the same URLs as DRF reverse
+    """
+
+    def test_url(self):
+        from rest_framework.reverse import reverse as api_reverse
+        request = RequestFactory().get('/', secure=True)
+        for name,args in [
+                ('rg-article', ['12-1-A (play)']),
+                ('rg-article', ['Nisei: "Oh, Yeah?" & 100% / more']),
+                ('rg-api-author', ['Brian Niiya']),
+                ('rg-source', ['en-littletokyousa-1']),
+                ('rg-browse-fieldvalue', ['media-type', 'short stories']),
+                ('rg-article', ['/./odd']),
+        ]:
+            self.assertEqual(
+                links.url(name, *args, request=request),
+                api_reverse(name, args=args, request=request)
+            )
+            self.assertEqual(links.url(name, *args), api_reverse(name, args=args))
+
+
+class Renderer(SimpleTestCase):
+    """API output includes aggregations and matches DRF's JSON
+    """
+
+    def test_render(self):
+        from collections import OrderedDict
+        from datetime import datetime, timezone
+        from elasticsearch_dsl.utils import AttrDict, AttrList
+        data = OrderedDict([
+            ('objects', [{'id': 'A', 'modified': datetime(2020, 1, 2, 3, 4, 5)}]),
+            ('aggregations', AttrDict({
+                'rg_rgmediatype': AttrList([{'key': 'books', 'doc_count': 2}]),
+            })),
+            ('utc', datetime(2020, 1, 2, tzinfo=timezone.utc)),
+        ])
+        self.assertEqual(json.loads(renderers.ORJSONRenderer().render(data)), {
+            'objects': [{'id': 'A', 'modified': '2020-01-02T03:04:05'}],
+            'aggregations': {
+                'rg_rgmediatype': [{'key': 'books', 'doc_count': 2}],
+            },
+            'utc': '2020-01-02T00:00:00Z',
+        })
+        self.assertEqual(renderers.ORJSONRenderer().render(None), b'')
+
+    def test_like_drf(self):
+        from datetime import datetime, timezone
+        from decimal import Decimal
+        from rest_framework.renderers import JSONRenderer
+        data = {
+            'micro': datetime(2020, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc),
+            'decimal': Decimal('1.5'),
+        }
+        self.assertEqual(
+            json.loads(renderers.ORJSONRenderer().render(data)),
+            json.loads(JSONRenderer().render(data))
+        )
+        # the browsable API asks for indentation in the renderer context
+        self.assertIn(b'\n', renderers.ORJSONRenderer().render(
+            data, 'text/html', {'indent': 4}
+        ))
+        self.assertIn(b'\n', renderers.ORJSONRenderer().render(
+            data, 'application/json; indent=2'
+        ))
+        self.assertNotIn(b'\n', renderers.ORJSONRenderer().render(
+            data, 'application/json', {}
+        ))
+
+
+class SourceFields(SimpleTestCase):
+    """Lists fetch only the fields that are shown
+    """
+
+    def test_source_fields(self):
+        from . import models
+        self.assertEqual(models.source_fields('article'), models.PAGE_LIST_FIELDS)
+        self.assertNotIn('body', models.source_fields('article'))
+        self.assertEqual(
+            models.source_fields('article', ['modified', 'title']),
+            ['url_title', 'title', 'description', 'modified']
+        )
+        self.assertEqual(
+            models.source_fields('source', ['headword']),
+            ['encyclopedia_id', 'headword']
+        )
+
+
+class PublishedRG(SimpleTestCase):
+    """published_rg filters articles only, in offset and cursor listings
+    """
+
+    def test_published_rg(self):
+        from . import models
+        docstore = mock.Mock()
+        docstore.index_name = lambda model: 'encyc%s' % model
+        with mock.patch.object(models, 'DOCSTORE', docstore), \
+             mock.patch.object(search.search.Searcher, 'prepare') as prepare, \
+             mock.patch.object(search.search.Searcher, 'execute'), \
+             mock.patch.object(search.search.Searcher, '__init__', return_value=None), \
+             mock.patch.object(search.search.Searcher, 's', create=True), \
+             mock.patch.object(search, 'cursor_search') as cursor_search, \
+             mock.patch.object(generation.CONTENT, 'current', return_value='a'):
+            for model,offset_list,expected in [
+                    ('article', models.Page.pages, True),
+                    ('author', models.Author.authors, False),
+                    ('source', models.Source.sources, False),
+            ]:
+                offset_list(limit=1)
+                models.cursor_results(model, 1)
+                params = prepare.call_args[0][0]
+                filters = cursor_search.call_args[0][3]
+                self.assertEqual(params.get('published_rg', False), expected)
+                self.assertEqual(filters.get('published_rg', False), expected)
+
+
+class BulkIds(SimpleTestCase):
+    """?ids= and POST {"ids": [...]} return objects in order, with misses marked
+    """
+
+    class Doc():
+        def __init__(self, doc_id):
+            self.doc_id = doc_id
+        def dict_all(self, request):
+            return {'id': self.doc_id, 'title': self.doc_id.upper()}
+
+    def get(self, request, ids):
+        docs = [self.Doc(doc_id) if doc_id != 'missing' else None for doc_id in ids]
+        with mock.patch.object(api.models.Author, 'get_many', return_value=docs), \
+             mock.patch.object(generation.CONTENT, 'current', return_value='a'):
+            return api.authors(request)
+
+    def test_ids(self):
+        ids = ['b', 'missing', 'a']
+        expected = [
+            {'id': 'b', 'title': 'B'},
+            {'id': 'missing', 'detail': 'Not found.'},
+            {'id': 'a', 'title': 'A'},
+        ]
+        response = self.get(RequestFactory().get('/', {'ids': 'b,missing,a'}), ids)
+        self.assertEqual(response.data['objects'], expected)
+        request = RequestFactory().post(
+            '/', json.dumps({'ids': ids}), content_type='application/json'
+        )
+        self.assertEqual(self.get(request, ids).data['objects'], expected)
+        for body in ['{}', '"b"', '3', 'null', '[1, 2]']:
+            request = RequestFactory().post('/', body, content_type='application/json')
+            self.assertEqual(self.get(request, []).status_code, 400)
+
+
+class ListingLimits(SimpleTestCase):
+    """Offset listings refuse bad limit/offset before asking Elasticsearch
+    """
+
+    def test_bad_limit_offset(self):
+        for view in [api.articles, api.authors, api.sources]:
+            for query in [{'limit': 'x'}, {'limit': 0}, {'offset': -1}]:
+                request = RequestFactory().get('/', query)
+                with mock.patch.object(generation.CONTENT, 'current', return_value='a'):
+                    self.assertEqual(view(request).status_code, 400)
+
+
+
+class Changes(SimpleTestCase):
+    """Change feed pages are in modified order, RG articles only
+    """
+
+    def hit(self, index, doc_id, modified):
+        hit = mock.Mock(modified=modified)
+        hit.meta.index = index
+        hit.meta.id = doc_id
+        return hit
+
+    def test_changes(self):
+        hits = [
+            self.hit('encycsource', 'en-denshopd-i35-00428-1', '2023-04-01T00:00:00'),
+            self.hit('encycarticle', 'Manzanar', '2023-04-02T00:00:00'),
+            self.hit('othersource', 'stray', '2023-04-03T00:00:00'),
+        ]
+        docstore = mock.Mock()
+        docstore.index_name = lambda model: 'encyc%s' % model
+        with mock.patch.object(api.models, 'DOCSTORE', docstore), \
+             mock.patch.object(api.models.search, 'cursor_search',
+                               return_value=(hits, 3, None)) as cursor_search, \
+             mock.patch.object(generation.CONTENT, 'current', return_value='a'):
+            response = api.changes(
+                RequestFactory().get('/', {'since': '2023-04-01 12:30'})
+            )
+            self.assertEqual(
+                cursor_search.call_args[0][-1],
+                {'modified': {'gte': '2023-04-01T12:30:00'}}
+            )
+            # articles not in the RG are left out, not sent as tombstones
+            self.assertEqual(
+                cursor_search.call_args[1]['excludes'], {'published_rg': False}
+            )
+            bad = api.changes(RequestFactory().get('/', {'since': '2023-13-01'}))
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(response.data['since'], '2023-04-01T12:30:00')
+        objects = response.data['objects']
+        # hits from an unknown index are skipped
+        self.assertEqual(
+            [(o['id'], o['model']) for o in objects],
+            [('en-denshopd-i35-00428-1', 'source'), ('Manzanar', 'article')]
+        )
+        self.assertTrue(objects[0]['links']['json'].endswith('/sources/en-denshopd-i35-00428-1/'))
+        self.assertIsNone(response.data['next'])
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Two-tier cache backend: per-worker LRU in front of a shared cache
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'rg.tieredcache.TieredCache',
+            'LOCATION': 'redis',  # alias of the shared (L2) cache
+            'OPTIONS': {'L1_MAX_ENTRIES': 1000, 'L1_TIMEOUT': 10},
+        },
+        'redis': {...},
+    }
+
+Reads are served from a bounded in-process LRU (L1) when possible and
+fall through to the shared cache (L2).  Writes go to both.  L1 entries live
+at most L1_TIMEOUT seconds, so values set or deleted by another worker show
+up here within that time.
+
+L1 entries also carry the version stamp that was current when they were
+stored.  The stamp is the content generation (see rg.generation), so
+republishing evicts L1 in every worker, plus a value in L2 that
+invalidate() (and clear()) replaces.  Every worker checks the stamp at most
+every STAMP_INTERVAL seconds and ignores L1 entries with an older one.  Run
+"manage.py invalidatecache" to evict L1 in all workers at once.  Set the
+FOLLOW_GENERATION option to False to use the L2 value only.
+
+The hit and miss counters in stats() are updated under a lock.
+
+Values are pickled in L1, like LocMemCache, so callers can't modify
+each other's objects.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+import pickle
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+from .prepared import LRUCache
+
+
+STAMP_KEY = 'encyc-rg:l1-stamp'
+
+_missing = object()
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = location
+        self.l1 = LRUCache(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = options.get('L1_TIMEOUT', 10)
+        self.stamp_interval = options.get('STAMP_INTERVAL', 1)
+        self.follow_generation = options.get('FOLLOW_GENERATION', True)
+        self._stamp = None
+        self._stamp_checked = 0
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def stamp(self):
+        """Current L1 version stamp, re-read every stamp_interval
+
+        @returns: (L2 stamp, content generation token)
+        """
+        now = time.monotonic()
+        if now - self._stamp_checked > self.stamp_interval:
+            self._stamp = (self.l2.get(STAMP_KEY), self._generation())
+            self._stamp_checked = now
+        return self._stamp
+
+    def _generation(self):
+        if not self.follow_generation:
+            return None
+        from . import generation
+        # the token last polled by request handling: reads never wait on
+        # the docstore
+        return generation.CONTENT.last()
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self):
+        """Evict L1 in every worker (takes up to stamp_interval seconds)
+        """
+        self.l2.set(STAMP_KEY, uuid.uuid4().hex, None)
+        self._stamp_checked = 0
+        self.l1.clear()
+
+    def stats(self):
+        return {
+            'l1_entries': len(self.l1),
+            'l1_hits': self.hits,
+            'l1_misses': self.misses,
+        }
+
+    def _l1_key(self, key, version):
+        return self.l2.make_key(key, version=version)
+
+    def _l1_get(self, l1_key):
+        entry = self.l1.get(l1_key)
+        if entry is not None:
+            pickled,expires,stamp = entry
+            if expires > time.time() and stamp == self.stamp():
+                self._count(True)
+                return pickle.loads(pickled)
+            self.l1.delete(l1_key)
+        self._count(False)
+        return _missing
+
+    def _l1_set(self, l1_key, value, timeout=DEFAULT_TIMEOUT):
+        expires = time.time() + self.l1_timeout
+        backend_expires = self.get_backend_timeout(timeout)
+        if backend_expires is not None:
+            expires = min(expires, backend_expires)
+        self.l1.set(
+            l1_key,
+            (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires, self.stamp())
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self._l1_key(key, version)
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self._l1_set(l1_key, value, timeout)
+        else:
+            self.l1.delete(l1_key)
+        return added
+
+    def get(self, key, default=None, version=None):
+        l1_key = self._l1_key(key, version)
+        value = self._l1_get(l1_key)
+        if value is _missing:
+            value = self.l2.get(key, _missing, version)
+            if value is _missing:
+                return default
+            self._l1_set(l1_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        self._l1_set(self._l1_key(key, version), value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(self._l1_key(key, version))
+        return self.l2.delete(key, version)
+
+    def get_many(self, keys, version=None):
+        data = {}
+        misses = []
+        for key in keys:
+            value = self._l1_get(self._l1_key(key, version))
+            if value is _missing:
+                misses.append(key)
+            else:
+                data[key] = value
+        if misses:
+            found = self.l2.get_many(misses, version)
+            for key,value in found.items():
+                self._l1_set(self._l1_key(key, version), value)
+            data.update(found)
+        return data
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        for key,value in data.items():
+            if key not in failed:
+                self._l1_set(self._l1_key(key, version), value, timeout)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.l1.delete(self._l1_key(key, version))
+        self.l2.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        if self._l1_get(self._l1_key(key, version)) is not _missing:
+            return True
+        return self.l2.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(self._l1_key(key, version))
+        return self.l2.incr(key, delta, version)
+
+    def clear(self):
+        self.l2.clear()
+        self.invalidate()
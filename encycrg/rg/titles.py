@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""In-process index of article and author titles
+
+Each worker keeps one TitleIndex, built the first time it is needed and
+rebuilt when the article or author index generation changes.  views.article
+checks it before going to Elasticsearch: a title that is not a published
+article is redirected or answered with 404 straight away.  This acts as a
+negative cache for the old wiki URLs that crawlers keep requesting.
+
+Redirects are worked out when the index is built (see redirect_table), so
+answering one is a dict lookup.
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+import threading
+
+from django.urls import reverse
+
+from . import generation
+from . import models
+
+
+class TitleIndex():
+    """Sets of published article and author url_titles
+    """
+
+    def __init__(self):
+        self.generation = generation.Subset(generation.CONTENT, ['article', 'author'])
+        self.built = None  # generation token of current sets
+        self.articles = frozenset()
+        self.authors = frozenset()
+        self.redirects = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Rebuild title sets if the index generation has changed
+        """
+        token = self.generation.current()
+        if token == self.built:
+            return
+        with self._lock:
+            if token == self.built:
+                return
+            logger.info('building title index %s' % token)
+            articles = frozenset(models.Page.titles())
+            authors = frozenset(models.Author.titles())
+            self.redirects = redirect_table(articles, authors)
+            self.articles = articles
+            self.authors = authors
+            self.built = token
+
+    def is_article(self, url_title):
+        self.refresh()
+        return url_title in self.articles
+
+    def is_author(self, url_title):
+        self.refresh()
+        return url_title in self.authors
+
+    def redirect(self, url_title):
+        """URL to redirect a missing article title to, if any
+
+        @param url_title: str
+        @returns: str URL or None
+        """
+        self.refresh()
+        return self.redirects.get(url_title)
+
+
+def redirect_table(articles, authors):
+    """Map alternate titles to the URL they should redirect to
+
+    - Author names (e.g. from bylines) go to the author page
+    - MediaWiki-style titles (underscores for spaces, lowercase first
+      letter) go to the article
+
+    Only titles of existing pages are redirected, and a title is never
+    redirected away from a published article.
+
+    @param articles: set of article url_titles
+    @param authors: set of author url_titles
+    @returns: dict {url_title: URL}
+    """
+    urls = {title: reverse('rg-article', args=([title])) for title in articles}
+    table = {}
+    # later entries win: exact titles with underscores over author names,
+    # author names over lowercased titles
+    for title,url in urls.items():
+        lower = title[:1].lower() + title[1:]
+        table[lower] = table[lower.replace(' ','_')] = url
+    for title in authors:
+        table[title] = reverse('rg-author', args=([title]))
+    for title,url in urls.items():
+        table[title.replace(' ','_')] = url
+    for title in articles:
+        table.pop(title, None)
+    return table
+
+
+INDEX = TitleIndex()
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from django.conf import settings
 from django.contrib.sitemaps.views import sitemap
 from django.urls import path, re_path
 from django.views.generic import TemplateView
@@ -13,6 +14,33 @@ from . import api
 from . import sitemaps
 from . import views
 
+# ASGI deployments use async versions of the busiest views (see rg.asyncviews)
+if settings.ASYNC_VIEWS:
+    from . import asyncviews
+    article = asyncviews.article
+    search_ui = asyncviews.search_ui
+    browse_field = asyncviews.browse_field
+    browse_field_value = asyncviews.browse_field_value
+    browse_filter = asyncviews.browse_filter
+    api_article = asyncviews.api_article
+    api_author = asyncviews.api_author
+    api_source = asyncviews.api_source
+    api_search = asyncviews.api_search
+    api_browse_facet_objects = asyncviews.api_browse_facet_objects
+    api_browse_filter = asyncviews.api_browse_filter
+else:
+    article = views.article
+    search_ui = views.search_ui
+    browse_field = views.browse_field
+    browse_field_value = views.browse_field_value
+    browse_filter = views.browse_filter
+    api_article = api.article
+    api_author = api.author
+    api_source = api.source
+    api_search = api.search
+    api_browse_facet_objects = api.browse_facet_objects
+    api_browse_filter = api.browse_filter
+
 SITEMAPS = {
     'pages': sitemaps.PageSitemap,
 }
@@ -33,6 +61,8 @@ schema_view = yasg_views.get_schema_view(
 
 urlpatterns = [
     path('debug/', views.debug, name='rg-debug'),
+    path('ready/', views.ready, name='rg-ready'),
+    path('stats/', views.stats, name='rg-stats'),
     path('sitemap.xml', sitemap, {'sitemaps': SITEMAPS}, name='wikiprox-sitemap'),
     
     path('api/swagger.json',
@@ -48,28 +78,32 @@ urlpatterns = [
          schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'
     ),
     
-    re_path(r'^api/3.0/browse/(?P<stub>[\w\W]+)/(?P<value>[\w\W]+)/', api.browse_facet_objects, name='rg-api-browse-fieldvalue'),
+    path('api/3.0/browse/filter/', api_browse_filter, name='rg-api-browse-filter'),
+    re_path(r'^api/3.0/browse/(?P<stub>[\w\W]+)/(?P<value>[\w\W]+)/', api_browse_facet_objects, name='rg-api-browse-fieldvalue'),
     re_path(r'^api/3.0/browse/(?P<stub>[\w\W]+)/', api.browse_facet, name='rg-api-browse-field'),
     path('api/3.0/browse/', api.browse, name='rg-api-browse'),
-    re_path(r'^api/3.0/articles/(?P<url_title>[\w\W]+)/', api.article, name='rg-api-article'),
-    re_path(r'^api/3.0/authors/(?P<url_title>[\w\W]+)/', api.author, name='rg-api-author'),
-    re_path(r'^api/3.0/sources/(?P<url_title>[\w\W]+)/', api.source, name='rg-api-source'),
+    re_path(r'^api/3.0/articles/(?P<url_title>[\w\W]+)/', api_article, name='rg-api-article'),
+    re_path(r'^api/3.0/authors/(?P<url_title>[\w\W]+)/', api_author, name='rg-api-author'),
+    re_path(r'^api/3.0/sources/(?P<url_title>[\w\W]+)/', api_source, name='rg-api-source'),
     path('api/3.0/articles/', api.articles, name='rg-api-articles'),
     path('api/3.0/authors/', api.authors, name='rg-api-authors'),
     path('api/3.0/sources/', api.sources, name='rg-api-sources'),
+    path('api/3.0/export/', api.export, name='rg-api-export'),
+    path('api/3.0/changes/', api.changes, name='rg-api-changes'),
     path('api/3.0/search/help/', TemplateView.as_view(template_name="rg/api/search-help.html"), name='rg-api-search-help'),
-    path('api/3.0/search/', api.search, name='rg-api-search'),
+    path('api/3.0/search/', api_search, name='rg-api-search'),
     path('api/3.0/', api.index, name='rg-api-index'),
 
     re_path(r'api/(?P<version>[\d]+)/*', api.bad_version, name='rg-api-bad-version'),
     path('api/', api.redirect, name='rg-api-old-redirect'),
     
     path('browse/title/', views.articles, name='rg-articles'),
-    re_path(r'^browse/(?P<stub>[\w\W]+)/(?P<value>[\w\W]+)/', views.browse_field_value, name='rg-browse-fieldvalue'),
-    re_path(r'^browse/(?P<stub>[\w\W]+)/', views.browse_field, name='rg-browse-field'),
+    path('browse/filter/', browse_filter, name='rg-browse-filter'),
+    re_path(r'^browse/(?P<stub>[\w\W]+)/(?P<value>[\w\W]+)/', browse_field_value, name='rg-browse-fieldvalue'),
+    re_path(r'^browse/(?P<stub>[\w\W]+)/', browse_field, name='rg-browse-field'),
     path('browse/', views.browse, name='rg-browse'),
     
-    path('search/', views.search_ui, name='rg-search'),
+    path('search/', search_ui, name='rg-search'),
     
     re_path(r'^authors/(?P<url_title>[\w\W]+)/', views.author, name='rg-author'),
     re_path(r'^sources/(?P<url_title>[\w\W]+)/', views.source, name='rg-source'),
@@ -81,7 +115,7 @@ urlpatterns = [
     path('terms/', TemplateView.as_view(template_name="rg/terms-of-use.html"), name='rg-terms'),
     
     re_path(r'^wiki/(?P<url_title>[\w\W]+)/', views.wiki_article, name='rg-wiki-article'),
-    re_path(r'^(?P<url_title>[\w\W ,.:\(\)-/]+)/', views.article, name='rg-article'),
+    re_path(r'^(?P<url_title>[\w\W ,.:\(\)-/]+)/', article, name='rg-article'),
     
     path('', views.index, name='rg-index'),
 ]
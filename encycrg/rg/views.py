@@ -2,42 +2,34 @@
 
 import logging
 logger = logging.getLogger(__name__)
+import os
 from urllib.parse import urlunparse
 
 from django.conf import settings
-from django.core.paginator import Paginator
-from django.http import HttpResponse, Http404
+from django.core.cache import cache
+from django.http import HttpResponse, Http404, JsonResponse
 from django.http import HttpResponsePermanentRedirect
 from django.shortcuts import render
-from django.template.loader import get_template
 from django.urls import reverse
 from django.views import View
-from django.views.decorators.cache import cache_page
 from django.views.debug import technical_500_response
 import elasticsearch
 
 from . import api
+from . import conditional
+from . import fetch
 from . import forms
+from . import generation
 from . import models
+from . import pagination
+from . import registry
 from . import search
-
-def load_templates(default):
-    logger.info('loading templates')
-    mt = {}
-    for m in models.Page.mediatypes():
-        try:
-            mt[m] = get_template('rg/article-%s.html' % m)
-        except:
-            mt[m] = default
-    return mt
-
-DEFAULT_ARTICLE_LIST_TEMPLATE = get_template('rg/article.html')
-MEDIATYPE_TEMPLATES = load_templates(DEFAULT_ARTICLE_LIST_TEMPLATE)
-
+from . import stalecache
+from . import titles
 
 def _mkurl(request, path, query=None):
     return urlunparse((
-        request.META['wsgi.url_scheme'],
+        request.scheme,  # wsgi.url_scheme is not set under ASGI
         request.META.get('HTTP_HOST'),
         path, None, query, None
     ))
@@ -78,11 +70,43 @@ Scroll down to view request metadata and application settings.
 class Debug(Exception):
     pass
 
+def ready(request):
+    """Readiness probe: 200 if the docstore and its indexes are available
+    
+    Replaces the cluster check that used to run when rg.models was imported.
+    """
+    status = {}
+    try:
+        for model in ['article', 'author', 'source']:
+            index = models.DOCSTORE.index_name(model)
+            status[index] = models.DOCSTORE.es.indices.exists(index=index)
+    except elasticsearch.exceptions.TransportError as err:
+        logger.error('readiness check failed: %s' % err)
+        status['error'] = str(err)
+    ready = bool(status) and all([
+        value is True for value in status.values()
+    ])
+    return JsonResponse(
+        {'ready': ready, 'indexes': status}, status=200 if ready else 503
+    )
+
+def stats(request):
+    """Counters for this worker process
+    """
+    data = {
+        'pid': os.getpid(),
+        'templates': registry.REGISTRY.stats(),
+    }
+    if hasattr(cache, 'stats'):
+        data['cache'] = cache.stats()
+    return JsonResponse(data)
+
 def debug(request):
     return technical_500_response(request, Debug, Debug(DEBUG_TEXT), None)
 
 
-@cache_page(settings.CACHE_TIMEOUT)
+@conditional.listing
+@stalecache.cache_page
 def articles(request):
     initials,groups,total = models.Page.pages_by_initial()
     return render(request, 'rg/articles.html', {
@@ -94,48 +118,74 @@ def articles(request):
     })
 
 def wiki_article(request, url_title):
-    return HttpResponsePermanentRedirect(reverse('rg-article', args=([url_title])))
+    return HttpResponsePermanentRedirect(
+        titles.INDEX.redirect(url_title)
+        or reverse('rg-article', args=([url_title]))
+    )
 
-@cache_page(settings.CACHE_TIMEOUT)
+@conditional.document('article')
+@generation.cache_page
 def article(request, url_title):
-    article_titles = models.Page.titles()
-    article = None
+    # unknown titles are answered without asking Elasticsearch
+    if not titles.INDEX.is_article(url_title):
+        redirect_url = titles.INDEX.redirect(url_title)
+        if redirect_url:
+            return HttpResponsePermanentRedirect(redirect_url)
+        raise Http404("No article with that title.")
+    # the article and its sources are fetched at the same time
+    plan = fetch.FetchPlan()
+    plan.add('article', models.Page.get, url_title)
+    plan.add(
+        'sources', models.Source.for_headword, url_title,
+        fields=models.ARTICLE_SOURCE_FIELDS
+    )
     try:
-        article = models.Page.get(url_title)
-    except models.docstore.NotFoundError as err:
-        # Bad title might just be an author link
-        if '_' in url_title:
-            return HttpResponsePermanentRedirect(
-                reverse('rg-article', args=([
-                    url_title.replace('_',' ')
-                ]))
-            )
-        if url_title in article_titles:
-            return HttpResponsePermanentRedirect(reverse('rg-author', args=([url_title])))
-        raise Http404("No article with that title. (%s)" % err)
-    except elasticsearch.exceptions.NotFoundError as err:
-        # Bad title might just be an author link
-        if '_' in url_title:
-            return HttpResponsePermanentRedirect(
-                reverse('rg-article', args=([
-                    url_title.replace('_',' ')
-                ]))
-            )
-        if url_title in article_titles:
-            return HttpResponsePermanentRedirect(reverse('rg-author', args=([url_title])))
+        article = plan.result('article')
+    except (
+            models.docstore.NotFoundError,
+            elasticsearch.exceptions.NotFoundError
+    ) as err:
+        plan.cancel()
+        # Bad title might be a MediaWiki-style title or an author link
+        redirect_url = titles.INDEX.redirect(url_title)
+        if redirect_url:
+            return HttpResponsePermanentRedirect(redirect_url)
         raise Http404("No article with that title. (%s)" % err)
+    if not article:
+        plan.cancel()
+        raise Http404("No article with that title.")
     # choose only the first source
     source = None
     if article.source_ids:
         try:
-            source = models.Source.get(article.source_ids[0])
-        except NotFoundError:
+            source = _first_source(article, plan.result('sources'))
+        except elasticsearch.exceptions.TransportError:
             pass
+        if not source:
+            # source filed under a different headword
+            try:
+                source = models.Source.get(
+                    article.source_ids[0], fields=models.ARTICLE_SOURCE_FIELDS
+                )
+            except models.NotFoundError:
+                pass
+    else:
+        # no sources wanted: drop the lookup if it has not started
+        plan.cancel()
+    return _render_article(request, url_title, article, source)
+
+def _first_source(article, sources):
+    """The article's first Source, if it is among sources
+    """
+    if article.source_ids:
+        for source in sources:
+            if source.encyclopedia_id == article.source_ids[0]:
+                return source
+    return None
+
+def _render_article(request, url_title, article, source):
     # some mediatypes have special templates
-    t = MEDIATYPE_TEMPLATES.get(
-        article['rg_rgmediatype'][0],
-        DEFAULT_ARTICLE_LIST_TEMPLATE
-    )
+    t = registry.REGISTRY.get('article', article['rg_rgmediatype'][0])
     context = {
         'article': article.dict_all(request=request),
         'source': source,
@@ -145,16 +195,22 @@ def article(request, url_title):
     return HttpResponse(t.render(context, request))
 
 
-@cache_page(settings.CACHE_TIMEOUT)
+@conditional.listing
+@stalecache.cache_page
 def authors(request):
     return render(request, 'rg/authors.html', {
-        'results': api._authors(request, limit=settings.MAX_SIZE),
+        'results': models.Author.authors(limit=settings.MAX_SIZE).ordered_dict(
+            format_functions=models.FORMATTERS,
+            request=request,
+            pad=False,
+        ),
         'api_url': _mkurl(request, reverse('rg-api-authors')),
     })
 
+@conditional.document('author')
 def author(request, url_title):
     try:
-        author = api._author(request, url_title)
+        author = models.Author.get(url_title).dict_all(request)
     except models.NotFoundError:
         raise Http404("No author with that title.")
     return render(request, 'rg/author.html', {
@@ -163,13 +219,19 @@ def author(request, url_title):
     })
 
 
-@cache_page(settings.CACHE_TIMEOUT)
+@conditional.listing
+@stalecache.cache_page
 def sources(request):
     return render(request, 'rg/sources.html', {
-        'sources': api._sources(request),
+        'results': models.Source.sources(limit=settings.MAX_SIZE).ordered_dict(
+            format_functions=models.FORMATTERS,
+            request=request,
+            pad=False,
+        ),
         'api_url': _mkurl(request, reverse('rg-api-sources')),
     })
 
+@conditional.document('source')
 def source(request, url_title):
     api_url = _mkurl(request, reverse('rg-api-source', args=([url_title])))
     r = api.source(request, url_title, format='json')
@@ -181,7 +243,7 @@ def source(request, url_title):
     })
 
 
-@cache_page(settings.CACHE_TIMEOUT)
+@generation.cache_page
 def browse(request):
     api_url = _mkurl(request, reverse('rg-api-browse'))
     r = api._browse(request)
@@ -190,7 +252,7 @@ def browse(request):
         'api_url': api_url,
     })
 
-@cache_page(settings.CACHE_TIMEOUT)
+@generation.cache_page
 def browse_field(request, stub):
     if stub not in models.MEDIATYPE_URLSTUBS:
         raise Http404
@@ -210,7 +272,7 @@ def browse_field(request, stub):
         'api_url': api_url,
     })
 
-@cache_page(settings.CACHE_TIMEOUT)
+@generation.cache_page
 def browse_field_value(request, stub, value):
     if stub not in models.MEDIATYPE_URLSTUBS:
         raise Http404
@@ -226,17 +288,12 @@ def browse_field_value(request, stub, value):
             raise Http404
     else:
         context_value = value
-    thispage = int(request.GET.get('page', 1))
+    thispage = max(int(request.GET.get('page', 1)), 1)
     pagesize = settings.RESULTS_PER_PAGE
     offset = models.search_offset(thispage, pagesize)
     results = models.Page.browse_field_objects(stub, value, pagesize, offset)
-    paginator = Paginator(
-        results.ordered_dict(
-            format_functions=models.FORMATTERS,
-            request=request,
-            pad=True,
-        )['objects'],
-        results.page_size,
+    paginator = pagination.ResultsPaginator.from_results(
+        results, request, models.FORMATTERS
     )
     page = paginator.page(results.this_page)
     return render(request, 'rg/browse-fieldvalue.html', {
@@ -252,6 +309,35 @@ def browse_field_value(request, stub, value):
     })
 
 
+def browse_filter(request):
+    api_url = '%s?%s' % (
+        _mkurl(request, reverse('rg-api-browse-filter')),
+        request.META['QUERY_STRING']
+    )
+    filters = models.facets.filters_from_query(request.GET)
+    thispage = max(int(request.GET.get('page', 1)), 1)
+    pagesize = settings.RESULTS_PER_PAGE
+    offset = models.search_offset(thispage, pagesize)
+    results = models.Page.browse_filter(
+        filters,
+        operator=request.GET.get('operator', 'or'),
+        limit=pagesize, offset=offset,
+    )
+    paginator = pagination.ResultsPaginator.from_results(
+        results, request, models.FORMATTERS
+    )
+    page = paginator.page(results.this_page)
+    return render(request, 'rg/browse-filter.html', {
+        'api_url': api_url,
+        'filters': [
+            (models.FACET_FIELDS[fieldname], values)
+            for fieldname,values in filters.items()
+        ],
+        'paginator': paginator,
+        'page': page,
+    })
+
+
 def search_ui(request):
     api_url = '%s?%s' % (
         _mkurl(request, reverse('rg-api-search')),
@@ -273,19 +359,15 @@ def search_ui(request):
             fields=models.PAGE_SEARCH_FIELDS,
             fields_nested={},
             fields_agg=models.PAGE_AGG_FIELDS,
+            source_fields=models.LIST_FIELDS['article'],
         )
         context['search_performed'] = True
     
     if searcher.params.get('fulltext'):
         limit,offset = search.limit_offset(request, settings.RESULTS_PER_PAGE)
         results = searcher.execute(limit, offset)
-        paginator = Paginator(
-            results.ordered_dict(
-                request=request,
-                format_functions=models.FORMATTERS,
-                pad=True,
-            )['objects'],
-            results.page_size,
+        paginator = pagination.ResultsPaginator.from_results(
+            results, request, models.FORMATTERS
         )
         page = paginator.page(results.this_page)
         
@@ -313,6 +395,7 @@ def search_ui(request):
     else:
         form = forms.SearchForm(
             data=request.GET.copy(),
+            aggregations=models.Page.facet_counts(),
         )
         context['search_form'] = form
 